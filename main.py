@@ -1,6 +1,6 @@
 import difflib
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
 from docx import Document
 import os
 import re
@@ -9,10 +9,40 @@ from tkinter import filedialog, messagebox, scrolledtext, ttk
 import sys
 import webbrowser
 import shutil
+import fnmatch
+import itertools
+import heapq
+import contextlib
+import atexit
 import urllib.parse
 from urllib.robotparser import RobotFileParser
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import multiprocessing
+import hashlib
+import json
+import codecs
+import random
+import uuid
+import http.client
+import email.utils
+import gzip
+import zipfile
+import xml.etree.ElementTree as ET
+import html
+from html.parser import HTMLParser
+import soupsieve
+import urllib3
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# Use the C-based lxml tree builder when it is installed, it parses pages
+# several times faster than the pure-Python html.parser
+try:
+    import lxml.etree
+    USE_LXML = True
+except ImportError:
+    USE_LXML = False
 
 # Try to import tkinterdnd2, fall back to regular tkinter if not available
 try:
@@ -23,7 +53,7 @@ except ImportError:
 
 # ------------------ Helper Functions ------------------
 
-def get_document_url_pairs(docx_files, parent_window):
+def get_document_url_pairs(docx_files, parent_window, ingestion=None):
     match_window = tk.Toplevel(parent_window)
     match_window.title("Match DOCX Files to URLs")
     window_width = 1200
@@ -257,7 +287,7 @@ def get_document_url_pairs(docx_files, parent_window):
             if not base_url:
                 messagebox.showerror("Missing URL", "Please enter a base URL")
                 return
-            matches = auto_match_documents(docx_files, base_url, match_window)
+            matches = auto_match_documents(docx_files, base_url, match_window, ingestion)
             if matches:
                 matched_pairs = matches
                 match_window.grab_release()
@@ -291,223 +321,1672 @@ def get_document_url_pairs(docx_files, parent_window):
     match_window.wait_window()
     return matched_pairs
 
-# ------------------ Remaining Functions ------------------
+# ------------------ HTTP Client ------------------
+
+DEFAULT_HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-User': '?1',
+    'Cache-Control': 'max-age=0'
+}
+
+_http_session = None
+_http_timeout = 30
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Return the process-wide HTTP session, creating it on first use.
+
+    The session keeps a keep-alive connection pool per host so that every page
+    fetched from the same site reuses its TCP/TLS connection. Pool sizes,
+    timeout, redirect limit and extra headers come from the settings file.
+    """
+    global _http_session, _http_timeout
+    if _http_session is not None:
+        return _http_session
+
+    with _http_session_lock:
+        if _http_session is None:
+            settings = load_settings()
+
+            # Suppress only the single InsecureRequestWarning from urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+            session = requests.Session()
+            # Ignore SSL certificate verification, for the crawler as well
+            session.verify = False
+            session.max_redirects = int(settings['http_max_redirects'])
+            session.headers.update(DEFAULT_HTTP_HEADERS)
+
+            # Extra headers are stored as "Name: value" pairs separated by "||",
+            # which unlike ";" cannot be part of a value (Cookie: a=1; b=2)
+            for header in settings['http_headers'].split('||'):
+                if ':' in header:
+                    name, value = header.split(':', 1)
+                    session.headers[name.strip()] = value.strip()
+
+            # One pool per host, each holding up to pool_maxsize idle connections
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=int(settings['http_pool_connections']),
+                pool_maxsize=int(settings['http_pool_maxsize']),
+                pool_block=False
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+            _http_timeout = float(settings['http_timeout'])
+            _http_session = session
+    return _http_session
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_host_limiter = None
+_retry_settings = None
+
+def get_host_limiter():
+    """Return the shared per-host concurrency controller"""
+    global _host_limiter
+    if _host_limiter is None:
+        with _http_session_lock:
+            if _host_limiter is None:
+                settings = load_settings()
+                _host_limiter = HostLimiter(int(settings['fetch_per_host']), int(settings['fetch_max_per_host']))
+    return _host_limiter
+
+def get_retry_delay(response, attempt):
+    """Seconds to wait before retrying: Retry-After if given, else jittered backoff"""
+    retries, backoff, max_delay = _retry_settings
+    retry_after = response.headers.get('Retry-After', '').strip() if response is not None else ''
+    if retry_after:
+        if retry_after.isdigit():
+            return min(float(retry_after), max_delay)
+        try:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+            return min(max(0.0, retry_at.timestamp() - time.time()), max_delay)
+        except (TypeError, ValueError):
+            pass
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(max_delay, backoff * (2 ** attempt)))
+
+def http_get(url, **kwargs):
+    """GET a URL through the shared session using the configured timeout.
+
+    Connection errors, timeouts and 429/5xx responses are retried with
+    exponential backoff (honoring Retry-After). Every attempt holds a slot in
+    the per-host controller, which shrinks the host's concurrency when it
+    throttles or slows down. After the last retry the final response is
+    returned, or the final exception raised, as usual.
+
+    With stream=True the slot is freed once the headers have arrived; use
+    http_stream to keep it for the whole body download.
+    """
+    response, _ = send_http_get(url, kwargs, hold_slot=False)
+    return response
+
+@contextlib.contextmanager
+def http_stream(url, **kwargs):
+    """Streamed http_get that keeps the host's slot until the body is read.
+
+    The response is closed and the slot freed when the with block exits,
+    whether the body was consumed or abandoned. The latency reported to the
+    per-host controller is still the time to the response headers, not the
+    time taken by the whole download.
+    """
+    response, release = send_http_get(url, dict(kwargs, stream=True), hold_slot=True)
+    try:
+        yield response
+    finally:
+        # Releases the connection, or drops it if the body was abandoned
+        response.close()
+        release()
+
+def send_http_get(url, kwargs, hold_slot):
+    """Retry loop behind http_get and http_stream; returns (response, release).
+
+    With hold_slot the returned response keeps its per-host slot and
+    release() must be called to free it; otherwise release does nothing.
+    """
+    global _retry_settings
+    session = get_http_session()
+    kwargs.setdefault('timeout', _http_timeout)
+    kwargs.setdefault('allow_redirects', True)
+
+    if _retry_settings is None:
+        settings = load_settings()
+        _retry_settings = (
+            int(settings['http_retries']),
+            float(settings['retry_backoff']),
+            float(settings['retry_max_delay'])
+        )
+    retries = _retry_settings[0]
+
+    limiter = get_host_limiter()
+    host = urllib.parse.urlparse(url).netloc
+    for attempt in range(retries + 1):
+        limiter.acquire(host)
+        started = time.monotonic()
+        response = None
+        ok = None  # Errors other than the ones below say nothing about the host's load
+        try:
+            response = session.get(url, **kwargs)
+            ok = response.status_code not in RETRY_STATUS_CODES
+        except requests.exceptions.SSLError:
+            # Not transient; callers fall back to plain HTTP instead
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            ok = False
+            if attempt == retries:
+                raise
+        finally:
+            latency = time.monotonic() - started if ok else None
+            returned = response is not None and (ok or attempt == retries)
+            if not (hold_slot and returned):
+                limiter.release(host, ok=ok, latency=latency)
+
+        if ok or attempt == retries:
+            if hold_slot:
+                return response, lambda: limiter.release(host, ok=ok, latency=latency)
+            return response, lambda: None
+
+        delay = get_retry_delay(response, attempt)
+        if response is not None:
+            response.close()
+        time.sleep(delay)
+
+def get_cache_dir(name):
+    """Return (and create) a named sub-folder of the on-disk cache"""
+    settings = load_settings()
+    base_dir = settings['cache_location'] or os.path.join(os.path.dirname(__file__), "cache")
+    cache_dir = os.path.join(base_dir, name)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+class HttpCache:
+    """Disk-backed HTTP response cache with ETag/Last-Modified revalidation.
+
+    Entries are keyed by the final URL of a response. Each entry is stored as
+    a JSON metadata file plus a raw body file; the metadata file's mtime is
+    refreshed on every hit so that eviction can drop the least recently used
+    entries once the total body size exceeds max_bytes. A request URL that
+    redirected elsewhere is stored as a small alias pointing at the final URL.
+    """
+
+    def __init__(self, directory, ttl, max_bytes):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = sum(
+            entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith('.body')
+        )
+
+    def _path(self, url, suffix):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, url):
+        """Return the cached entry for url (following redirects) or None"""
+        with self._lock:
+            for _ in range(2):
+                meta_path = self._path(url, '.json')
+                try:
+                    with open(meta_path, 'r', encoding='utf-8') as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    return None
+                if 'alias' not in meta:
+                    break
+                url = meta['alias']
+            else:
+                return None
+
+            try:
+                with open(self._path(url, '.body'), 'rb') as f:
+                    body = f.read()
+            except OSError:
+                return None
+
+            # Mark as recently used for LRU eviction
+            os.utime(meta_path)
+            meta['body'] = body
+            meta['headers'] = requests.structures.CaseInsensitiveDict(meta['headers'])
+            return meta
+
+    def is_fresh(self, entry):
+        return time.time() - entry['stored_at'] < self.ttl
+
+    def put(self, request_url, final_url, status, headers, body):
+        """Store a response body and its validators"""
+        headers = dict(headers)
+        meta = {
+            'url': final_url,
+            'status': status,
+            'headers': headers,
+            'etag': headers.get('ETag') or headers.get('etag'),
+            'last_modified': headers.get('Last-Modified') or headers.get('last-modified'),
+            'stored_at': time.time()
+        }
+        with self._lock:
+            body_path = self._path(final_url, '.body')
+            if os.path.exists(body_path):
+                self._total_bytes -= os.path.getsize(body_path)
+            with open(body_path, 'wb') as f:
+                f.write(body)
+            with open(self._path(final_url, '.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            self._total_bytes += len(body)
+
+            if request_url != final_url:
+                with open(self._path(request_url, '.json'), 'w', encoding='utf-8') as f:
+                    json.dump({'alias': final_url}, f)
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def refresh(self, entry):
+        """Reset the TTL of an entry after a 304 Not Modified response"""
+        meta = {key: value for key, value in entry.items() if key != 'body'}
+        meta['headers'] = dict(meta['headers'])
+        meta['stored_at'] = time.time()
+        with self._lock:
+            with open(self._path(entry['url'], '.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                entries.append((entry.stat().st_mtime, entry.path))
+        entries.sort()
+
+        for _, meta_path in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            body_path = meta_path[:-len('.json')] + '.body'
+            try:
+                self._total_bytes -= os.path.getsize(body_path)
+                os.remove(body_path)
+            except OSError:
+                pass  # Aliases have no body of their own
+            try:
+                os.remove(meta_path)
+            except OSError:
+                pass
+
+_http_cache = None  # False once caching has been found to be disabled
+_http_cache_lock = threading.Lock()
+
+def get_http_cache():
+    """Return the shared HTTP cache, or None when caching is disabled"""
+    global _http_cache
+    if _http_cache is None:
+        with _http_cache_lock:
+            if _http_cache is None:
+                settings = load_settings()
+                if settings['http_cache_enabled'].lower() == 'true':
+                    _http_cache = HttpCache(
+                        get_cache_dir("http"),
+                        ttl=float(settings['http_cache_ttl']),
+                        max_bytes=int(settings['http_cache_max_mb']) * 1024 * 1024
+                    )
+                else:
+                    _http_cache = False
+    return _http_cache or None
+
+class FetchRejected(requests.exceptions.RequestException):
+    """Raised when a response is abandoned before its body is downloaded"""
+
+class ArchiveMiss(requests.exceptions.RequestException):
+    """Raised in replay mode when a URL was never recorded in the archive"""
+
+class FetchArchive:
+    """Record/replay archive of fetched pages in a single WARC file.
+
+    In record mode every page returned by fetch_page is appended as a gzip
+    compressed WARC/1.0 response record (URL, status, headers and body).
+    Error responses and rejected fetches are recorded too, without a body,
+    and a URL already in the archive is not recorded again; delete the
+    archive to record a site afresh. In replay mode the whole archive is
+    loaded up front and fetch_page serves every URL from it without any
+    network access, raising the same errors as during recording. A record
+    cut off by a crash while it was being written is ignored.
+    """
+
+    # The stored body is already decoded, so these no longer describe it
+    SKIPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self._pages = {}
+        self._recorded = set()
+        self._lock = threading.Lock()
+        if mode == 'replay':
+            if not os.path.exists(path):
+                raise ArchiveMiss(f"Replay archive not found: {path}")
+            self._load()
+        elif os.path.exists(path):
+            # Only the URLs are needed to skip pages that are already in it
+            self._load()
+            self._recorded = set(self._pages)
+            self._pages = {}
+
+    @staticmethod
+    def _read_fields(f):
+        """Read a record's WARC header fields, or return None if the file ends first"""
+        fields = {}
+        while True:
+            line = f.readline()
+            if not line:
+                return None
+            if line == b'\r\n':
+                return fields
+            name, _, value = line.decode('utf-8').partition(':')
+            fields[name.strip().lower()] = value.strip()
+
+    def _load(self):
+        with gzip.open(self.path, 'rb') as f:
+            try:
+                while True:
+                    line = f.readline()
+                    if not line:
+                        break
+                    if not line.startswith(b'WARC/'):
+                        continue
+
+                    fields = self._read_fields(f)
+                    if fields is None:
+                        break
+                    length = int(fields['content-length'])
+                    block = f.read(length)
+                    if len(block) < length:
+                        break
+                    f.read(4)  # Record separator
+                    self._add_record(fields, block)
+            except EOFError:
+                pass  # The last gzip member was cut off while being written
+
+    def _add_record(self, fields, block):
+        http_head, _, body = block.partition(b'\r\n\r\n')
+        status_line, *header_lines = http_head.decode('iso-8859-1').split('\r\n')
+        headers = requests.structures.CaseInsensitiveDict()
+        for header in header_lines:
+            name, _, value = header.partition(':')
+            headers[name.strip()] = value.strip()
+
+        _, status, reason = (status_line.split(' ', 2) + [''])[:3]
+        page = {
+            'url': fields['warc-target-uri'],
+            'status': int(status),
+            'reason': reason,
+            'headers': headers,
+            'body': body,
+            'from_cache': True
+        }
+        if fields.get('verbatimai-rejected'):
+            page['rejected'] = fields['verbatimai-rejected']
+        self._pages[page['url']] = page
+        if fields.get('verbatimai-request-uri'):
+            self._pages[fields['verbatimai-request-uri']] = page
+
+    def lookup(self, url):
+        """Return the recorded page for url, or None.
+
+        An https:// URL that was not recorded falls back to its http://
+        variant, which is what get_webpage_text fetched if the site failed
+        over to plain HTTP while recording.
+        """
+        page = self._pages.get(url)
+        if page is None and url.startswith('https://'):
+            page = self._pages.get('http://' + url[8:])
+        return page
+
+    def replay(self, url, html_only=False):
+        """Return the recorded page for url, or raise what fetching it raised while recording"""
+        page = self.lookup(url)
+        if page is None:
+            raise ArchiveMiss(f"Not found in the replay archive: {url}")
+        if 'rejected' in page:
+            raise FetchRejected(page['rejected'])
+        if page['status'] >= 400:
+            response = requests.Response()
+            response.status_code = page['status']
+            response.url = page['url']
+            response.headers = page['headers']
+            response.reason = page['reason']
+            response._content = page['body']
+            response.raise_for_status()
+        content_type = page['headers'].get('content-type', '').lower()
+        if html_only and 'text/html' not in content_type:
+            raise FetchRejected(f"Invalid content type: {content_type}")
+        return page
+
+    def record_error(self, request_url, error):
+        """Record the response behind an HTTP error or rejected fetch, without its body"""
+        response = error.response
+        if response is None:
+            return
+        page = {'url': response.url or request_url, 'status': response.status_code,
+                'reason': response.reason, 'headers': response.headers, 'body': b''}
+        rejected = str(error) if isinstance(error, FetchRejected) else None
+        self.record(request_url, page, rejected)
+
+    def record(self, request_url, page, rejected=None):
+        with self._lock:
+            if request_url in self._recorded:
+                return
+            self._recorded.update((request_url, page['url']))
+
+        headers = ''.join(
+            f"{name}: {value}\r\n" for name, value in page['headers'].items()
+            if name.lower() not in self.SKIPPED_HEADERS
+        )
+        reason = page.get('reason') or http.client.responses.get(page['status'], '')
+        block = f"HTTP/1.1 {page['status']} {reason}\r\n{headers}\r\n".encode('iso-8859-1', 'replace') + page['body']
+        rejected_field = f"VerbatimAI-Rejected: {rejected}\r\n" if rejected else ""
+        record = (
+            "WARC/1.0\r\n"
+            "WARC-Type: response\r\n"
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+            f"WARC-Date: {time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}\r\n"
+            f"WARC-Target-URI: {page['url']}\r\n"
+            f"VerbatimAI-Request-URI: {request_url}\r\n"
+            f"{rejected_field}"
+            "Content-Type: application/http;msgtype=response\r\n"
+            f"Content-Length: {len(block)}\r\n"
+            "\r\n"
+        ).encode('utf-8') + block + b'\r\n\r\n'
+
+        # One gzip member per record, as in .warc.gz files
+        with self._lock:
+            with gzip.open(self.path, 'ab') as f:
+                f.write(record)
+
+_fetch_archive = None  # False once the archive has been found to be off
+
+def get_fetch_archive():
+    """Return the record/replay archive, or None when archiving is off.
+
+    Raises ArchiveMiss when replay is on but the archive file is missing.
+    """
+    global _fetch_archive
+    if _fetch_archive is None:
+        with _http_cache_lock:
+            if _fetch_archive is None:
+                settings = load_settings()
+                mode = settings['fetch_archive_mode'].lower()
+                if mode in ('record', 'replay'):
+                    path = settings['fetch_archive_path'] or os.path.join(get_cache_dir("archive"), "fetch_archive.warc.gz")
+                    _fetch_archive = FetchArchive(path, mode)
+                else:
+                    _fetch_archive = False
+    return _fetch_archive or None
+
+def fetch_page(url, force_refresh=None, validators=None, html_only=False, max_size=None, on_chunk=None):
+    """Fetch a URL through the HTTP cache and return a page dict.
+
+    Fresh cache entries are returned without touching the network. Stale ones
+    are revalidated with If-None-Match / If-Modified-Since so that a 304 reuses
+    the stored body. The returned dict holds the final 'url', 'status',
+    'headers', raw 'body' bytes and whether it came 'from_cache'.
+
+    Callers that keep their own copy of a page can pass its 'etag' and
+    'last_modified' as validators. They are used when the cache has no entry,
+    and a 304 answer is then returned with status 304 and a body of None.
+
+    Bodies are streamed. With html_only, non-HTML responses are rejected from
+    their headers alone, and any body larger than max_size bytes (default:
+    the max_page_size_mb setting) is abandoned. Both raise FetchRejected.
+    If given, on_chunk(chunk, headers) is called with each body chunk as it
+    is downloaded; it is not called for pages that come from the cache.
+
+    When the fetch archive is recording, every returned page, HTTP error and
+    rejection is also written to it; when it is replaying, pages and errors
+    come from the archive only.
+    """
+    archive = get_fetch_archive()
+    if archive is not None and archive.mode == 'replay':
+        return archive.replay(url, html_only)
+
+    if archive is not None:
+        # The archive needs full bodies, not "not modified" answers
+        validators = None
+
+    try:
+        page = fetch_page_from_network(url, force_refresh, validators, html_only, max_size, on_chunk)
+    except (requests.exceptions.HTTPError, FetchRejected) as e:
+        if archive is not None:
+            archive.record_error(url, e)
+        raise
+    if archive is not None:
+        archive.record(url, page)
+    return page
+
+def fetch_page_from_network(url, force_refresh, validators, html_only, max_size, on_chunk=None):
+    """Fetch a page through the HTTP cache and the network (see fetch_page)"""
+    cache = get_http_cache()
+    if force_refresh is None:
+        force_refresh = load_settings()['http_cache_force_refresh'].lower() == 'true'
+
+    entry = None
+    if cache is not None and not force_refresh:
+        entry = cache.get(url)
+        if entry is not None and cache.is_fresh(entry):
+            return {
+                'url': entry['url'],
+                'status': entry['status'],
+                'headers': entry['headers'],
+                'body': entry['body'],
+                'from_cache': True
+            }
+
+    request_headers = {}
+    if entry is None and not force_refresh:
+        entry_validators = validators or {}
+    else:
+        entry_validators = entry or {}
+    if entry_validators.get('etag'):
+        request_headers['If-None-Match'] = entry_validators['etag']
+    if entry_validators.get('last_modified'):
+        request_headers['If-Modified-Since'] = entry_validators['last_modified']
+
+    # Stream the body so the headers can be checked before it is downloaded;
+    # the host's slot is held until the body is read or abandoned
+    with http_stream(url, headers=request_headers) as response:
+        if response.status_code == 304:
+            if entry is not None:
+                cache.refresh(entry)
+                return {
+                    'url': entry['url'],
+                    'status': entry['status'],
+                    'headers': entry['headers'],
+                    'body': entry['body'],
+                    'from_cache': True
+                }
+            if validators:
+                return {
+                    'url': response.url,
+                    'status': 304,
+                    'headers': response.headers,
+                    'body': None,
+                    'from_cache': False
+                }
+        response.raise_for_status()
+
+        content_type = response.headers.get('content-type', '').lower()
+        if html_only and 'text/html' not in content_type:
+            raise FetchRejected(f"Invalid content type: {content_type}", response=response)
+
+        max_bytes = max_size if max_size is not None else int(float(load_settings()['max_page_size_mb']) * 1024 * 1024)
+        limit_message = f"Page is larger than the {round(max_bytes / (1024 * 1024), 2):g} MB download limit"
+        content_length = response.headers.get('content-length', '')
+        if content_length.isdigit() and int(content_length) > max_bytes:
+            raise FetchRejected(limit_message, response=response)
+
+        chunks = []
+        received = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            received += len(chunk)
+            if received > max_bytes:
+                raise FetchRejected(limit_message, response=response)
+            chunks.append(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk, response.headers)
+        body = b''.join(chunks)
+
+    if cache is not None and response.status_code == 200:
+        cache.put(url, response.url, response.status_code, response.headers, body)
+
+    return {
+        'url': response.url,
+        'status': response.status_code,
+        'headers': response.headers,
+        'body': body,
+        'from_cache': False
+    }
+
+BYTE_ORDER_MARKS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16')
+]
+HEADER_CHARSET_PATTERN = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+
+def detect_page_encoding(page):
+    """Work out a page's character encoding without decoding the whole body.
+
+    Checks, in order, a byte order mark, the charset in the Content-Type
+    header and a <meta charset> / http-equiv declaration near the top of the
+    document. Statistical detection over the body only runs when none of
+    those is present. Returns (encoding, source).
+    """
+    body = page['body']
+    for bom, encoding in BYTE_ORDER_MARKS:
+        if body.startswith(bom):
+            return encoding, "byte order mark"
+
+    candidates = []
+    header_match = HEADER_CHARSET_PATTERN.search(page['headers'].get('content-type', ''))
+    if header_match:
+        candidates.append((header_match.group(1), "HTTP header"))
+    meta_match = META_CHARSET_PATTERN.search(body[:4096])
+    if meta_match:
+        candidates.append((meta_match.group(1).decode('ascii', 'ignore'), "meta tag"))
+
+    for encoding, source in candidates:
+        try:
+            return codecs.lookup(encoding).name, source
+        except LookupError:
+            continue  # Unknown charset label, try the next source
+
+    return requests.compat.chardet.detect(body)['encoding'] or 'utf-8', "detected"
+
+def get_page_markup(page, encoding=None):
+    """Decode a fetched page body using its declared (or detected) encoding"""
+    if encoding is None:
+        encoding, _ = detect_page_encoding(page)
+    try:
+        return str(page['body'], encoding, errors='replace')
+    except LookupError:
+        return str(page['body'], 'utf-8', errors='replace')
+
+class HostLimiter:
+    """Adaptive (AIMD) limit on how many requests may be in flight per host.
+
+    Every host starts at `initial` concurrent requests. Each success adds
+    1/limit (about one extra slot per round of successful requests, up to
+    `maximum`); a throttling response, a connection error or a response time
+    well above the host's usual latency halves the limit, at most once per
+    `cooldown` seconds, down to a single request at a time.
+    """
+
+    def __init__(self, initial, maximum, latency_factor=2.0, cooldown=1.0):
+        self.initial = max(1, initial)
+        self.maximum = max(self.initial, maximum)
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self._hosts = {}
+        self._condition = threading.Condition()
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {
+                'limit': float(self.initial),
+                'active': 0,
+                'latency': None,
+                'baseline': None,
+                'last_decrease': 0.0
+            }
+        return state
+
+    def limit(self, host):
+        with self._condition:
+            return int(self._state(host)['limit'])
+
+    def acquire(self, host):
+        with self._condition:
+            state = self._state(host)
+            while state['active'] >= int(state['limit']):
+                self._condition.wait()
+            state['active'] += 1
+
+    def release(self, host, ok=True, latency=None):
+        """Free a slot; ok=False signals throttling, ok=None records nothing"""
+        with self._condition:
+            state = self._state(host)
+            state['active'] -= 1
+            if ok is None:
+                # Outcome says nothing about the host's load
+                self._condition.notify_all()
+                return
+
+            congested = not ok
+            if ok and latency is not None:
+                if state['latency'] is None:
+                    state['latency'] = state['baseline'] = latency
+                else:
+                    state['latency'] = 0.8 * state['latency'] + 0.2 * latency
+                    # The baseline follows the fastest responses and only
+                    # drifts up slowly, so a slowing host stands out
+                    if state['latency'] < state['baseline']:
+                        state['baseline'] = state['latency']
+                    else:
+                        state['baseline'] += (state['latency'] - state['baseline']) * 0.01
+                # Ignore jitter on very fast hosts: a few milliseconds of
+                # slowdown is not a sign of overload
+                congested = (state['latency'] > state['baseline'] * self.latency_factor and
+                             state['latency'] - state['baseline'] > 0.1)
+
+            now = time.monotonic()
+            if congested:
+                if now - state['last_decrease'] >= self.cooldown:
+                    state['limit'] = max(1.0, state['limit'] / 2)
+                    state['last_decrease'] = now
+            else:
+                state['limit'] = min(float(self.maximum), state['limit'] + 1.0 / state['limit'])
+            self._condition.notify_all()
+
+class HostThrottle:
+    """Per-host token bucket that spaces out requests to the same host.
+
+    Each host gets a bucket of `burst` tokens refilled at `rate` tokens per
+    second. wait() blocks until a token is available for the host, so
+    concurrent workers share the host's budget instead of each sleeping a
+    fixed amount.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._host_rates = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def set_delay(self, host, delay):
+        """Allow one request every `delay` seconds to host (robots Crawl-delay)"""
+        with self._lock:
+            self._host_rates[host] = (1.0 / delay, 1)
+
+    def wait(self, host):
+        with self._lock:
+            rate, burst = self._host_rates.get(host, (self.rate, self.burst))
+            if rate <= 0:
+                return
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(host, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            # Take a token now, even if that leaves the bucket in debt; the
+            # debt is the time this caller has to wait for its turn
+            tokens -= 1
+            self._buckets[host] = (tokens, now)
+            delay = -tokens / rate if tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+
+def fetch_webpages(urls, max_workers=None):
+    """Fetch many pages concurrently and yield (index, result, page_info) as each one arrives.
+
+    Each result is the (text, title, meta_description) tuple returned by
+    get_webpage_text, and page_info the details it recorded. max_workers
+    caps the number of fetches in flight and defaults to the settings file;
+    requests to any one host are further limited by the adaptive per-host
+    controller in http_get.
+    """
+    if max_workers is None:
+        max_workers = int(load_settings()['fetch_max_workers'])
+
+    def fetch(url):
+        page_info = {}
+        return get_webpage_text(url, page_info), page_info
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        future_to_index = {executor.submit(fetch, url): index for index, url in enumerate(urls)}
+        for future in as_completed(future_to_index):
+            result, page_info = future.result()
+            yield future_to_index[future], result, page_info
+    finally:
+        # Stop queued fetches if the consumer gives up early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# ------------------ Remaining Functions ------------------
+
+def get_html_parser():
+    """Return the BeautifulSoup tree builder to use for HTML.
+
+    The html_parser setting picks 'lxml' or 'html.parser'; 'auto' uses lxml
+    when it is installed. A request for lxml without lxml installed falls
+    back to html.parser.
+    """
+    parser = load_settings()['html_parser'].lower()
+    if parser == 'html.parser' or not USE_LXML:
+        return 'html.parser'
+    return 'lxml'
+
+_html_parser = None
+
+def make_soup(markup):
+    """Parse HTML markup with the configured parser backend"""
+    global _html_parser
+    if _html_parser is None:
+        _html_parser = get_html_parser()
+    return BeautifulSoup(markup, _html_parser)
+
+CONTENT_BLOCK_TAGS = {"p", "li", "h1", "h2", "h3", "h4", "h5", "h6"}
+STRUCTURED_CONTAINER_KEYWORDS = [
+    'faq', 'accordion', 'expandable', 'collapse', 'toggle',
+    'uagb-faq', 'uagb-container', 'wp-block-uagb'
+]
+STRUCTURED_SECTION_KEYWORDS = ['faq', 'frequently-asked', 'accordion', 'expandable', 'collapse']
+HIDDEN_STYLES = ['display: none', 'visibility: hidden']
+PAGE_CHROME_TAGS = {'nav', 'header', 'footer'}
+
+def has_class_keyword(tag, keywords):
+    """Check whether any of the tag's classes contains one of the keywords"""
+    return any(keyword in cls.lower() for cls in tag.get('class', []) for keyword in keywords)
+
+def has_hidden_style(tag):
+    style = tag.get('style')
+    return bool(style) and any(hidden in style.lower() for hidden in HIDDEN_STYLES)
+
+def extract_content_blocks(main):
+    """Return the text of every p/li/h1-h6 element under main in document order.
+
+    Elements inside FAQ/accordion containers are left to the structured
+    content pass. Headings are additionally dropped when they are hidden by an
+    inline style, sit inside nav/header/footer, or carry a menu/nav class.
+
+    This is a single depth-first walk: ancestor context (inside a structured
+    container, hidden, inside page chrome) is carried down the tree as flags,
+    and all text is collected once into a shared list so each element's text
+    is a slice of it rather than a fresh traversal of its subtree.
+    """
+    # Context contributed by main itself and everything above it
+    inside_structured = hidden = in_chrome = False
+    for node in [main, *main.parents]:
+        inside_structured = inside_structured or has_class_keyword(node, STRUCTURED_CONTAINER_KEYWORDS)
+        hidden = hidden or has_hidden_style(node)
+        in_chrome = in_chrome or node.name in PAGE_CHROME_TAGS
+
+    strings = []
+    blocks = []
+    context = (inside_structured, hidden, in_chrome)
+    stack = [(child, context) for child in reversed(main.contents)]
+    while stack:
+        node, context = stack.pop()
+
+        # Closing marker: the element's text is everything collected since it opened
+        if node is None:
+            block_index, tag, start = context
+            text = " ".join(strings[start:])
+            if len(text) > 1:
+                if tag.name.startswith('h'):
+                    blocks[block_index] = f"<{tag.name}>{text}</{tag.name}>"
+                else:
+                    blocks[block_index] = text
+            continue
+
+        if not isinstance(node, Tag):
+            # Same string types as Tag.get_text(): no comments, doctypes etc.
+            if type(node) in (NavigableString, CData):
+                text = node.strip()
+                if text:
+                    strings.append(text)
+            continue
+
+        inside_structured, hidden, in_chrome = context
+        if node.name in CONTENT_BLOCK_TAGS and not inside_structured:
+            is_hidden_heading = node.name.startswith('h') and (
+                hidden or has_hidden_style(node) or in_chrome or
+                any('menu' in cls.lower() or 'nav' in cls.lower() for cls in node.get('class', []))
+            )
+            if not is_hidden_heading:
+                # Reserve the block's slot now so blocks stay in document order
+                blocks.append(None)
+                stack.append((None, (len(blocks) - 1, node, len(strings))))
+
+        child_context = (
+            inside_structured or has_class_keyword(node, STRUCTURED_CONTAINER_KEYWORDS),
+            hidden or has_hidden_style(node),
+            in_chrome or node.name in PAGE_CHROME_TAGS
+        )
+        stack.extend((child, child_context) for child in reversed(node.contents))
+
+    return [block for block in blocks if block is not None]
+
+def is_structured_section(tag):
+    """Check whether a tag is an FAQ, accordion, tab list or UAGB container"""
+    role = tag.get('role')
+    if role == 'tablist' or role == 'tab':
+        return True
+    for cls in tag.get('class', []):
+        lower_cls = cls.lower()
+        if (cls.startswith('uagb-faq') or cls.startswith('wp-block-uagb-faq') or
+                'uagb-container-inner-blocks-wrap' in cls or
+                any(keyword in lower_cls for keyword in STRUCTURED_SECTION_KEYWORDS)):
+            return True
+    return False
+
+def find_structured_sections(main):
+    """Return the outermost structured content sections under main in document order.
+
+    A single walk over the tree; once a section is found its subtree is not
+    searched again, so nested accordions/FAQ wrappers are only processed once.
+    """
+    sections = []
+    stack = [child for child in reversed(main.contents) if isinstance(child, Tag)]
+    while stack:
+        tag = stack.pop()
+        if is_structured_section(tag):
+            sections.append(tag)
+            continue
+        stack.extend(child for child in reversed(tag.contents) if isinstance(child, Tag))
+    return sections
+
+def extract_qa_pairs(section):
+    """Return the (question, answer) text pairs found in a structured section"""
+    # Find all question/answer pairs using multiple approaches
+    qa_pairs = []
+    
+    # Method 1: UAGB FAQ structure
+    questions = section.find_all(class_='uagb-question')
+    for question in questions:
+        # Get the FAQ item container
+        faq_item = question.find_parent(class_=lambda x: x and 'uagb-faq-item' in str(x))
+        if faq_item:
+            # Find the answer within this FAQ item
+            answer = faq_item.find(class_='uagb-faq-content')
+            if answer:
+                q_text = ' '.join(question.stripped_strings)
+                a_text = ' '.join(answer.stripped_strings)
+                if q_text and a_text:
+                    qa_pairs.append((q_text, a_text))
+    
+    # Method 2: Generic FAQ/Accordion structure
+    if not qa_pairs:
+        questions = section.find_all(lambda tag: (
+            tag.name in ['dt', 'summary'] or
+            (tag.get('class') and any(c for c in tag.get('class', []) if any(keyword in c.lower() for keyword in ['question', 'header', 'title', 'summary']))) or
+            tag.get('role') == 'tab'
+        ))
+        
+        for question in questions:
+            q_text = ' '.join(question.stripped_strings)
+            if not q_text:
+                continue
+            
+            # Try to find the corresponding answer
+            answer = None
+            
+            # Check for next sibling first
+            answer = question.find_next_sibling(lambda tag: (
+                tag.name == 'dd' or
+                (tag.get('class') and any(c for c in tag.get('class', []) if any(keyword in c.lower() for keyword in ['answer', 'content', 'panel', 'body']))) or
+                tag.get('role') == 'tabpanel'
+            ))
+            
+            # If no sibling found, try parent's next element
+            if not answer and question.parent:
+                answer = question.parent.find_next(lambda tag: (
+                    tag.name == 'dd' or
+                    (tag.get('class') and any(c for c in tag.get('class', []) if any(keyword in c.lower() for keyword in ['answer', 'content', 'panel', 'body']))) or
+                    tag.get('role') == 'tabpanel'
+                ))
+            
+            if answer:
+                a_text = ' '.join(answer.stripped_strings)
+                if a_text:
+                    qa_pairs.append((q_text, a_text))
+    
+    return qa_pairs
+
+def extract_section_paragraphs(section):
+    """Return the heading and Q:/A: paragraphs of a structured content section"""
+    paragraphs = []
+    
+    # Try to find a section heading first
+    section_heading = section.find(class_=lambda x: x and 'uagb-heading-text' in str(x))
+    if section_heading and section_heading.get_text(strip=True):
+        paragraphs.append(f"<h2>{section_heading.get_text(strip=True)}</h2>")
+    
+    # Add all found Q&A pairs to paragraphs
+    for q_text, a_text in extract_qa_pairs(section):
+        paragraphs.append(f"Q: {q_text}")
+        paragraphs.append(f"A: {a_text}")
+    return paragraphs
+
+class ExtractionProfile:
+    """CSS selectors describing where a site keeps its content, compiled once.
+
+    Every field is optional: 'main' selects the content container, 'exclude'
+    (a selector or list of selectors) removes elements from it, and
+    'faq_item', 'faq_question' and 'faq_answer' locate FAQ entries. Whatever
+    a profile leaves out is handled by the generic heuristics.
+    """
+
+    FIELDS = ('main', 'exclude', 'faq_item', 'faq_question', 'faq_answer')
+
+    def __init__(self, site, spec):
+        unknown = set(spec) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"unknown field(s) {', '.join(sorted(unknown))}")
+        exclude = spec.get('exclude')
+        if isinstance(exclude, list):
+            exclude = ', '.join(exclude)
+        
+        self.site = site
+        self.main = self._compile(spec.get('main'))
+        self.exclude = self._compile(exclude)
+        self.faq_item = self._compile(spec.get('faq_item'))
+        self.faq_question = self._compile(spec.get('faq_question'))
+        self.faq_answer = self._compile(spec.get('faq_answer'))
+        if self.faq_item and not (self.faq_question and self.faq_answer):
+            raise ValueError("faq_item needs both faq_question and faq_answer")
+        
+        # Part of the extraction cache key, so editing a profile invalidates its results
+        self.fingerprint = hashlib.sha1(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _compile(selector):
+        return soupsieve.compile(selector) if selector else None
+
+    def extract_qa_pairs(self, main):
+        """Return the (question, answer) text pairs of the FAQ items under main"""
+        qa_pairs = []
+        for item in self.faq_item.select(main):
+            question = self.faq_question.select_one(item)
+            answer = self.faq_answer.select_one(item)
+            if question and answer:
+                q_text = ' '.join(question.stripped_strings)
+                a_text = ' '.join(answer.stripped_strings)
+                if q_text and a_text:
+                    qa_pairs.append((q_text, a_text))
+        return qa_pairs
+
+_extraction_profiles = None
+_extraction_profiles_lock = threading.Lock()
+
+def load_extraction_profiles():
+    """Load and compile the per-site profiles from the extraction profiles file"""
+    path = load_settings()['extraction_profiles_path'] or os.path.join(
+        os.path.dirname(__file__), "config", "extraction_profiles.json")
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            specs = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error loading extraction profiles: {str(e)}")
+        return {}
+    
+    profiles = {}
+    for site, spec in specs.items():
+        try:
+            profiles[get_site_key(site)] = ExtractionProfile(site, spec)
+        except (ValueError, soupsieve.SelectorSyntaxError) as e:
+            print(f"Skipping extraction profile for {site}: {str(e)}")
+    return profiles
+
+def get_extraction_profile(url):
+    """Return the extraction profile for a page's site (or a parent domain), if any"""
+    global _extraction_profiles
+    if _extraction_profiles is None:
+        with _extraction_profiles_lock:
+            if _extraction_profiles is None:
+                _extraction_profiles = load_extraction_profiles()
+    if not _extraction_profiles:
+        return None
+    
+    site = get_site_key(url)
+    while site:
+        if site in _extraction_profiles:
+            return _extraction_profiles[site]
+        site = site.partition('.')[2]
+    return None
+
+def extract_page_content(soup, profile=None):
+    """Extract (text, title, meta_description) from a parsed page.
+
+    The soup is modified in place: scripts, navigation, header and footer
+    elements inside the main content area are removed. An ExtractionProfile
+    takes precedence over the generic container and FAQ heuristics for the
+    parts it describes.
+    """
+    # Get title
+    title = "Untitled Page"
+    if soup.title and soup.title.string:
+        title = soup.title.string.strip()
+    
+    # Get meta description
+    meta_description = ""
+    meta_desc_tag = soup.find("meta", attrs={"name": "description"})
+    if meta_desc_tag and meta_desc_tag.get("content"):
+        meta_description = meta_desc_tag["content"].strip()
+    
+    main = profile.main.select_one(soup) if profile and profile.main else None
+    if main is None:
+        # Try different content containers
+        content_containers = (
+            lambda: soup.find("main"),
+            lambda: soup.find("article"),
+            lambda: soup.find(id=lambda x: x and any(word in str(x).lower() for word in ['content', 'main', 'article'])),
+            lambda: soup.find(class_=lambda x: x and any(word in str(x).lower() for word in ['content', 'main-content', 'page-content', 'article'])),
+            lambda: soup.find("div", {"class": ["content", "main-content", "page-content", "article-content"]}),
+            lambda: soup.find("body")
+        )
+        for find_container in content_containers:
+            main = find_container()
+            if main is not None:
+                break
+    if not main:
+        return "[ERROR: Could not find main content area]", title, meta_description
+    
+    # Remove unwanted elements
+    for element in main.find_all(['script', 'style', 'iframe', 'noscript', 'header', 'footer', 'nav']):
+        element.decompose()
+    if profile and profile.exclude:
+        for element in profile.exclude.select(main):
+            element.decompose()
+    
+    # FAQ items described by the profile are taken out of the tree so they
+    # are reported once, as Q&A pairs, after the regular content
+    profile_qa_pairs = None
+    if profile and profile.faq_item:
+        profile_qa_pairs = profile.extract_qa_pairs(main)
+        for item in profile.faq_item.select(main):
+            item.decompose()
+    
+    # Extract clean paragraphs while preserving structure
+    # First, handle regular content
+    paragraphs = extract_content_blocks(main)
+    
+    for q_text, a_text in profile_qa_pairs or []:
+        paragraphs.append(f"Q: {q_text}")
+        paragraphs.append(f"A: {a_text}")
+    
+    # Then, handle structured content sections
+    structured_sections = find_structured_sections(main) if profile_qa_pairs is None else []
+    for section in structured_sections:
+        paragraphs.extend(extract_section_paragraphs(section))
+    
+    if not paragraphs:
+        return "[ERROR: No content found on page]", title, meta_description
+        
+    # Join paragraphs with double newlines to preserve structure
+    raw_text = "\n\n".join(paragraphs)
+    return raw_text, title, meta_description
+
+def collect_page_hrefs(soup):
+    """Return the raw hrefs a crawler follows from a parsed page.
+
+    Returns (hrefs, menu_hrefs): the href of every link-like element, and
+    the hrefs of anchors inside menu/navigation containers. Must be called
+    before extract_page_content strips the navigation out of the tree.
+    """
+    hrefs = [element.get('href') for element in soup.find_all(['a', 'link', 'area', 'base', 'nav', 'menu'])
+             if element.get('href')]
+    menu_hrefs = []
+    for menu_item in soup.find_all(class_=lambda x: x and any(word in str(x).lower() for word in ['menu', 'nav', 'navigation'])):
+        menu_hrefs.extend(link['href'] for link in menu_item.find_all('a', href=True))
+    return hrefs, menu_hrefs
+
+# Bump whenever a change to extraction alters its output, so that cached
+# results from the old extractor are not reused
+EXTRACTOR_VERSION = 1
+
+class ExtractionCache:
+    """Content-addressed cache of extraction results.
+
+    Entries are keyed by a hash of the raw page body, its encoding, the HTML
+    parser backend, the site's extraction profile and EXTRACTOR_VERSION, so
+    the same HTML is only parsed once whether it comes from the network, the
+    HTTP cache or a replayed archive. Recent entries are kept in an in-memory
+    LRU; when a directory is given they are also written there as JSON files,
+    least recently used files being removed once there are more than
+    max_disk_entries.
+    """
+
+    def __init__(self, max_entries, directory=None, max_disk_entries=0):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_entries = 0
+        if directory:
+            self._disk_entries = sum(1 for entry in os.scandir(directory) if entry.name.endswith('.json'))
+
+    @staticmethod
+    def key(body, encoding, parser, profile_fingerprint=None):
+        digest = hashlib.sha256(body)
+        digest.update(f"|{encoding}|{parser}|{profile_fingerprint}|{EXTRACTOR_VERSION}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached result for key or None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if not self.directory:
+            return None
+        
+        path = os.path.join(self.directory, key + '.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, result)
+        return result
+
+    def put(self, key, result):
+        self._remember(key, result)
+        if not self.directory:
+            return
+        
+        path = os.path.join(self.directory, key + '.json')
+        with self._lock:
+            is_new = not os.path.exists(path)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(result, f)
+            if is_new:
+                self._disk_entries += 1
+            if self._disk_entries > self.max_disk_entries:
+                self._evict()
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _evict(self):
+        """Remove least recently used files until at most max_disk_entries remain"""
+        entries = sorted(
+            (entry.stat().st_mtime, entry.path)
+            for entry in os.scandir(self.directory) if entry.name.endswith('.json')
+        )
+        for _, path in entries[:max(0, len(entries) - self.max_disk_entries)]:
+            try:
+                os.remove(path)
+                self._disk_entries -= 1
+            except OSError:
+                pass
+
+_extraction_cache = None  # False once caching has been found to be disabled
+_extraction_cache_lock = threading.Lock()
+
+def get_extraction_cache():
+    """Return the shared extraction cache, or None when it is disabled"""
+    global _extraction_cache
+    if _extraction_cache is None:
+        with _extraction_cache_lock:
+            if _extraction_cache is None:
+                settings = load_settings()
+                if settings['extract_cache_enabled'].lower() == 'true':
+                    use_disk = settings['extract_cache_disk'].lower() == 'true'
+                    _extraction_cache = ExtractionCache(
+                        int(settings['extract_cache_entries']),
+                        directory=get_cache_dir("extract") if use_disk else None,
+                        max_disk_entries=int(settings['extract_cache_disk_entries'])
+                    )
+                else:
+                    _extraction_cache = False
+    return _extraction_cache or None
+
+def extract_page(page, encoding=None):
+    """Extract a fetched HTML page, reusing the result if the same HTML was seen before.
+
+    Returns a dict with the extracted 'text', 'title' and 'meta' description
+    plus the raw 'hrefs' and 'menu_hrefs' found by collect_page_hrefs. The
+    dict is shared with the cache and must not be modified.
+    """
+    if encoding is None:
+        encoding, _ = detect_page_encoding(page)
+    
+    profile = get_extraction_profile(page['url'])
+    cache = get_extraction_cache()
+    if cache:
+        global _html_parser
+        if _html_parser is None:
+            _html_parser = get_html_parser()
+        key = cache.key(page['body'], encoding, _html_parser, profile.fingerprint if profile else None)
+        result = cache.get(key)
+        if result is not None:
+            return result
+    
+    soup = make_soup(get_page_markup(page, encoding))
+    hrefs, menu_hrefs = collect_page_hrefs(soup)
+    text, title, meta = extract_page_content(soup, profile)
+    result = {'text': text, 'title': title, 'meta': meta, 'hrefs': hrefs, 'menu_hrefs': menu_hrefs}
+    if cache:
+        cache.put(key, result)
+    return result
+
+def get_extractor_identity(url):
+    """Describe the extractor extract_page uses for url: version, parser backend and profile.
+
+    Stored alongside extracted content that outlives a run, so that it can
+    be extracted again once any of them changes.
+    """
+    global _html_parser
+    if _html_parser is None:
+        _html_parser = get_html_parser()
+    profile = get_extraction_profile(url)
+    return f"{EXTRACTOR_VERSION}|{_html_parser}|{profile.fingerprint if profile else None}"
+
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+REMOVED_TAGS = {'script', 'style', 'iframe', 'noscript', 'header', 'footer', 'nav'}
+# Main content containers in the order extract_page_content tries them
+MAIN_CONTAINER_KINDS = ('main', 'article', 'id', 'class')
+
+class StreamingExtractor(HTMLParser):
+    """Incremental page extractor fed with body chunks while they download.
+
+    Applies the rules of extract_page_content to a stream of parser events
+    instead of a finished tree: a block's text is produced as soon as its
+    closing tag is seen, and only the text of currently open blocks is kept.
+    Since the main content container is not known until the whole page has
+    been seen, each block remembers which candidate containers it was in and
+    the choice is made in finish(). Structured (FAQ/accordion) sections are
+    the only markup buffered; each one is parsed on its own when it closes.
+
+    Bytes are held back until the first 4 KB are in (or the body ends) so
+    that the encoding can be detected like detect_page_encoding does.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.encoding = self.encoding_source = None
+        self.started = False
+        self._headers = {}
+        self._pending = b''
+        self._decoder = None
+        
+        self._title = None  # Text parts of the first <title>, once it opens
+        self._in_title = False
+        self._meta_description = None
+        
+        # Open elements: (tag, child context, container kinds opened, block, section start)
+        self._stack = []
+        self._seen_kinds = set()
+        self._active_kinds = set()
+        self._data = []
+        self._template_depth = 0
+        self._strings = []
+        self._open_blocks = 0
+        self._blocks = []  # [text or None, container kinds]
+        self._section = None  # Markup of the structured section being captured
+        self._sections = []  # (paragraphs, container kinds)
+
+    def feed_chunk(self, chunk, headers):
+        """Feed the next raw body chunk of a response with the given headers"""
+        self.started = True
+        if self._decoder is None:
+            self._headers = headers
+            self._pending += chunk
+            if len(self._pending) < 4096:
+                return
+            self._start_decoding()
+        else:
+            self.feed(self._decoder.decode(chunk))
+
+    def _start_decoding(self):
+        self.encoding, self.encoding_source = detect_page_encoding({'body': self._pending, 'headers': self._headers})
+        decoder_encoding = self.encoding
+        if self.encoding_source == "detected" and self.encoding.lower() == 'ascii':
+            # Only the start of the body was looked at; the rest may not be ASCII
+            decoder_encoding = 'utf-8'
+        try:
+            self._decoder = codecs.getincrementaldecoder(decoder_encoding)(errors='replace')
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        pending, self._pending = self._pending, b''
+        self.feed(self._decoder.decode(pending))
+
+    def _context(self):
+        return self._stack[-1][1] if self._stack else (False, False, False)
+
+    @staticmethod
+    def _container_kinds(tag, attrs):
+        """Return which kinds of main content container an element could be"""
+        kinds = []
+        if tag in ('main', 'article'):
+            kinds.append(tag)
+        element_id = (attrs.get('id') or '').lower()
+        if any(word in element_id for word in ['content', 'main', 'article']):
+            kinds.append('id')
+        classes = ' '.join(attrs['class']).lower()
+        if any(word in classes for word in ['content', 'main-content', 'page-content', 'article']):
+            kinds.append('class')
+        return kinds
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_data()
+        attrs = dict(attrs)
+        attrs['class'] = (attrs.get('class') or '').split()
+        inside_structured, hidden, removed = self._context()
+        
+        if tag == 'title' and self._title is None:
+            self._title = []
+            self._in_title = True
+        elif tag == 'meta' and self._meta_description is None and attrs.get('name') == 'description':
+            self._meta_description = (attrs.get('content') or '').strip()
+        
+        removed = removed or tag in REMOVED_TAGS
+        if self._section is not None and not removed:
+            self._section.append(self.get_starttag_text())
+        if tag in VOID_TAGS:
+            return
+        
+        # Only the first container of each kind is a candidate, as with soup.find()
+        kinds = [kind for kind in self._container_kinds(tag, attrs) if kind not in self._seen_kinds]
+        self._seen_kinds.update(kinds)
+        self._active_kinds.update(kinds)
+        
+        block = None
+        if tag in CONTENT_BLOCK_TAGS and not inside_structured and not removed:
+            is_hidden_heading = tag.startswith('h') and (
+                hidden or has_hidden_style(attrs) or
+                any('menu' in cls.lower() or 'nav' in cls.lower() for cls in attrs['class'])
+            )
+            if not is_hidden_heading:
+                # Reserve the block's slot now so blocks stay in document order
+                self._blocks.append([None, frozenset(self._active_kinds)])
+                block = (len(self._blocks) - 1, len(self._strings))
+                self._open_blocks += 1
+        
+        starts_section = self._section is None and not removed and is_structured_section(attrs)
+        if starts_section:
+            self._section = [self.get_starttag_text()]
+        
+        if tag == 'template':
+            self._template_depth += 1
+        
+        child_context = (
+            inside_structured or has_class_keyword(attrs, STRUCTURED_CONTAINER_KEYWORDS),
+            hidden or has_hidden_style(attrs),
+            removed
+        )
+        self._stack.append((tag, child_context, kinds, block, starts_section))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        self._flush_data()
+        if tag == 'title':
+            self._in_title = False
+        if not any(entry[0] == tag for entry in self._stack):
+            return  # Stray end tag
+        while self._stack:
+            entry = self._stack.pop()
+            self._close(entry)
+            if entry[0] == tag:
+                break
+
+    def _close(self, entry):
+        tag, (_, _, removed), kinds, block, starts_section = entry
+        if self._section is not None and not removed:
+            self._section.append(f"</{tag}>")
+        
+        if block is not None:
+            block_index, start = block
+            text = " ".join(self._strings[start:])
+            if len(text) > 1:
+                self._blocks[block_index][0] = f"<{tag}>{text}</{tag}>" if tag.startswith('h') else text
+            self._open_blocks -= 1
+            if not self._open_blocks:
+                self._strings = []
+        
+        self._active_kinds.difference_update(kinds)
+        if tag == 'template':
+            self._template_depth -= 1
+        
+        if starts_section:
+            section = make_soup("".join(self._section)).find(tag)
+            self._section = None
+            if section is not None:
+                self._sections.append((extract_section_paragraphs(section), frozenset(self._active_kinds)))
+
+    def handle_data(self, data):
+        # A text node can arrive in pieces when it spans chunks; it is
+        # handled once the next markup event shows that it is complete
+        self._data.append(data)
+
+    def _flush_data(self):
+        if not self._data:
+            return
+        data = "".join(self._data)
+        self._data = []
+        if self._in_title:
+            self._title.append(data)
+        if self._context()[2]:
+            return
+        if self._section is not None:
+            self._section.append(html.escape(data, quote=False))
+        # Template contents are not part of the rendered page
+        if self._open_blocks and not self._template_depth:
+            text = data.strip()
+            if text:
+                self._strings.append(text)
+
+    def handle_comment(self, data):
+        self._flush_data()
+
+    def handle_decl(self, decl):
+        self._flush_data()
+
+    def handle_pi(self, data):
+        self._flush_data()
+
+    def unknown_decl(self, data):
+        self._flush_data()
+        if data.startswith('CDATA['):
+            self._data.append(data[len('CDATA['):])
+            self._flush_data()
+
+    def finish(self):
+        """Process whatever is still buffered and return (text, title, meta_description)"""
+        if self._decoder is None:
+            self._start_decoding()
+        self.feed(self._decoder.decode(b'', final=True))
+        self.close()
+        self._flush_data()
+        while self._stack:
+            self._close(self._stack.pop())
+        
+        title = "".join(self._title).strip() if self._title else "Untitled Page"
+        meta_description = self._meta_description or ""
+        
+        main_kind = next((kind for kind in MAIN_CONTAINER_KINDS if kind in self._seen_kinds), None)
+        paragraphs = [text for text, kinds in self._blocks
+                      if text is not None and (main_kind is None or main_kind in kinds)]
+        for section_paragraphs, kinds in self._sections:
+            if main_kind is None or main_kind in kinds:
+                paragraphs.extend(section_paragraphs)
+        
+        if not paragraphs:
+            return "[ERROR: No content found on page]", title, meta_description
+        return "\n\n".join(paragraphs), title, meta_description
+
+def extract_page_streamed(page, extractor=None):
+    """Extract a page with a StreamingExtractor, reusing the result if the same HTML was seen before.
+
+    extractor is the one the page was fed to while it downloaded, if any;
+    otherwise the stored body is fed to a new one in one go. Results are
+    cached apart from extract_page's, since the streaming extractor handles
+    broken markup the way html.parser does whichever backend is configured.
+    Returns a dict with 'text', 'title', 'meta', 'encoding' and
+    'encoding_source'.
+    """
+    cache = get_extraction_cache()
+    if cache:
+        # The extractor works the encoding out from the body and Content-Type
+        key = cache.key(page['body'], page['headers'].get('content-type', ''), 'stream')
+        if extractor is None:
+            result = cache.get(key)
+            if result is not None:
+                return result
+    
+    if extractor is None:
+        extractor = StreamingExtractor()
+        extractor.feed_chunk(page['body'], page['headers'])
+    text, title, meta = extractor.finish()
+    result = {'text': text, 'title': title, 'meta': meta,
+              'encoding': extractor.encoding, 'encoding_source': extractor.encoding_source}
+    if cache:
+        cache.put(key, result)
+    return result
+
+def get_webpage_text(url, page_info=None):
+    """Fetch a live page and return its (text, title, meta_description).
 
-def get_webpage_text(url):
-    try:
-        # Configure session with proper settings
-        session = requests.Session()
-        session.verify = False  # Ignore SSL certificate verification
-        session.max_redirects = 5  # Allow up to 5 redirects
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1',
-            'Cache-Control': 'max-age=0'
-        }
+    Failures are reported as an "[ERROR: ...]" text. If a page_info dict is
+    given it is filled with the final 'url' and the 'encoding' (and
+    'encoding_source') used to decode the page.
 
-        # Suppress only the single InsecureRequestWarning from urllib3
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    With the streaming_extraction setting, pages downloaded from the network
+    are extracted by a StreamingExtractor while they arrive, and pages
+    served from a cache or archive are fed to one in one go (see
+    extract_page_streamed). Sites with an extraction profile still go
+    through extract_page.
+    """
+    try:
+        if not url.startswith(('http://', 'https://')):
+            url = 'https://' + url
+        extractor = None
+        if load_settings()['streaming_extraction'].lower() == 'true' and get_extraction_profile(url) is None:
+            extractor = StreamingExtractor()
+        on_chunk = extractor.feed_chunk if extractor else None
         
         # First try HTTPS
         try:
-            if not url.startswith(('http://', 'https://')):
-                url = 'https://' + url
-            response = session.get(url, headers=headers, timeout=30, allow_redirects=True)
-            response.raise_for_status()
+            page = fetch_page(url, html_only=True, on_chunk=on_chunk)
         except requests.exceptions.SSLError:
             # If HTTPS fails, try HTTP
             if url.startswith('https://'):
                 url = 'http://' + url[8:]
-            response = session.get(url, headers=headers, timeout=30, allow_redirects=True)
-            response.raise_for_status()
+            page = fetch_page(url, html_only=True, on_chunk=on_chunk)
         
         # Check content type
-        content_type = response.headers.get('content-type', '').lower()
+        content_type = page['headers'].get('content-type', '').lower()
         if 'text/html' not in content_type:
             return f"[ERROR: Invalid content type: {content_type}]", "Untitled Page", ""
         
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        # Get title
-        title = "Untitled Page"
-        if soup.title and soup.title.string:
-            title = soup.title.string.strip()
-        
-        # Get meta description
-        meta_description = ""
-        meta_desc_tag = soup.find("meta", attrs={"name": "description"})
-        if meta_desc_tag and meta_desc_tag.get("content"):
-            meta_description = meta_desc_tag["content"].strip()
-        
-        # Try different content containers
-        content_containers = [
-            soup.find("main"),
-            soup.find("article"),
-            soup.find(id=lambda x: x and any(word in str(x).lower() for word in ['content', 'main', 'article'])),
-            soup.find(class_=lambda x: x and any(word in str(x).lower() for word in ['content', 'main-content', 'page-content', 'article'])),
-            soup.find("div", {"class": ["content", "main-content", "page-content", "article-content"]}),
-            soup.find("body")
-        ]
-        
-        main = next((container for container in content_containers if container is not None), None)
-        if not main:
-            return "[ERROR: Could not find main content area]", title, meta_description
-        
-        # Remove unwanted elements
-        for element in main.find_all(['script', 'style', 'iframe', 'noscript', 'header', 'footer', 'nav']):
-            element.decompose()
+        if extractor is not None:
+            extracted = extract_page_streamed(page, extractor if extractor.started else None)
+            if page_info is not None:
+                page_info.update(url=page['url'], encoding=extracted['encoding'], encoding_source=extracted['encoding_source'])
+            return extracted['text'], extracted['title'], extracted['meta']
         
-        # Extract clean paragraphs while preserving structure
-        paragraphs = []
-        
-        # First, handle regular content
-        for tag in main.find_all(["p", "li", "h1", "h2", "h3", "h4", "h5", "h6"]):
-            # Skip empty tags
-            if not tag.get_text(strip=True):
-                continue
-                
-            # Skip if inside structured content section to avoid duplication
-            if tag.find_parent(class_=lambda x: x and any(keyword in str(x).lower() for keyword in [
-                'faq', 'accordion', 'expandable', 'collapse', 'toggle',
-                'uagb-faq', 'uagb-container', 'wp-block-uagb'
-            ])):
-                continue
-                
-            # Create a copy to work with
-            tag_copy = BeautifulSoup(str(tag), "html.parser")
-            
-            # Handle links by preserving their text
-            for a in tag_copy.find_all('a'):
-                if a.get_text(strip=True):
-                    a.unwrap()
-            
-            # Get the complete text of the element
-            text = tag_copy.get_text(" ", strip=True)
-            if text and len(text) > 1:
-                # For headings, check if they're visible and not hidden by CSS
-                if tag.name.startswith('h'):
-                    # Skip headings that are likely hidden
-                    parent_style = tag.get('style', '') + ' '.join(parent.get('style', '') for parent in tag.parents if parent.get('style'))
-                    if any(style in parent_style.lower() for style in ['display: none', 'visibility: hidden']):
-                        continue
-                    # Skip headings inside navigation, header, or footer
-                    if tag.find_parent(['nav', 'header', 'footer']):
-                        continue
-                    # Skip headings that are part of a menu or navigation
-                    if any('menu' in cls.lower() or 'nav' in cls.lower() for cls in tag.get('class', [])):
-                        continue
-                    paragraphs.append(f"<{tag.name}>{text}</{tag.name}>")
-                else:
-                    paragraphs.append(text)
-        
-        # Then, handle structured content sections
-        structured_content_patterns = [
-            # UAGB FAQ patterns
-            {'class_': lambda x: x and any(c for c in str(x).split() if c.startswith('uagb-faq'))},
-            {'class_': lambda x: x and any(c for c in str(x).split() if c.startswith('wp-block-uagb-faq'))},
-            # Generic FAQ patterns
-            {'class_': lambda x: x and any(keyword in str(x).lower() for keyword in ['faq', 'frequently-asked'])},
-            # Accordion patterns
-            {'class_': lambda x: x and any(keyword in str(x).lower() for keyword in ['accordion', 'expandable', 'collapse'])},
-            # ARIA patterns
-            {'role': 'tablist'},
-            {'role': 'tab'},
-            # Container patterns
-            {'class_': lambda x: x and 'uagb-container-inner-blocks-wrap' in str(x)}
-        ]
-        
-        # Find all structured content sections
-        structured_sections = []
-        for pattern in structured_content_patterns:
-            sections = main.find_all(**pattern)
-            structured_sections.extend(sections)
-        
-        # Remove duplicates while preserving order
-        seen = set()
-        structured_sections = [x for x in structured_sections if not (str(x) in seen or seen.add(str(x)))]
-        
-        # Process each structured section
-        for section in structured_sections:
-            # Try to find a section heading first
-            section_heading = section.find(class_=lambda x: x and 'uagb-heading-text' in str(x))
-            if section_heading and section_heading.get_text(strip=True):
-                paragraphs.append(f"<h2>{section_heading.get_text(strip=True)}</h2>")
-            
-            # Find all question/answer pairs using multiple approaches
-            qa_pairs = []
-            
-            # Method 1: UAGB FAQ structure
-            questions = section.find_all(class_='uagb-question')
-            for question in questions:
-                # Get the FAQ item container
-                faq_item = question.find_parent(class_=lambda x: x and 'uagb-faq-item' in str(x))
-                if faq_item:
-                    # Find the answer within this FAQ item
-                    answer = faq_item.find(class_='uagb-faq-content')
-                    if answer:
-                        q_text = ' '.join(question.stripped_strings)
-                        a_text = ' '.join(answer.stripped_strings)
-                        if q_text and a_text:
-                            qa_pairs.append((q_text, a_text))
-            
-            # Method 2: Generic FAQ/Accordion structure
-            if not qa_pairs:
-                questions = section.find_all(lambda tag: (
-                    tag.name in ['dt', 'summary'] or
-                    (tag.get('class') and any(c for c in tag.get('class', []) if any(keyword in c.lower() for keyword in ['question', 'header', 'title', 'summary']))) or
-                    tag.get('role') == 'tab'
-                ))
-                
-                for question in questions:
-                    q_text = ' '.join(question.stripped_strings)
-                    if not q_text:
-                        continue
-                    
-                    # Try to find the corresponding answer
-                    answer = None
-                    
-                    # Check for next sibling first
-                    answer = question.find_next_sibling(lambda tag: (
-                        tag.name == 'dd' or
-                        (tag.get('class') and any(c for c in tag.get('class', []) if any(keyword in c.lower() for keyword in ['answer', 'content', 'panel', 'body']))) or
-                        tag.get('role') == 'tabpanel'
-                    ))
-                    
-                    # If no sibling found, try parent's next element
-                    if not answer and question.parent:
-                        answer = question.parent.find_next(lambda tag: (
-                            tag.name == 'dd' or
-                            (tag.get('class') and any(c for c in tag.get('class', []) if any(keyword in c.lower() for keyword in ['answer', 'content', 'panel', 'body']))) or
-                            tag.get('role') == 'tabpanel'
-                        ))
-                    
-                    if answer:
-                        a_text = ' '.join(answer.stripped_strings)
-                        if a_text:
-                            qa_pairs.append((q_text, a_text))
-            
-            # Add all found Q&A pairs to paragraphs
-            for q_text, a_text in qa_pairs:
-                paragraphs.append(f"Q: {q_text}")
-                paragraphs.append(f"A: {a_text}")
+        encoding, encoding_source = detect_page_encoding(page)
+        if page_info is not None:
+            page_info.update(url=page['url'], encoding=encoding, encoding_source=encoding_source)
         
-        if not paragraphs:
-            return "[ERROR: No content found on page]", title, meta_description
-            
-        # Join paragraphs with double newlines to preserve structure
-        raw_text = "\n\n".join(paragraphs)
-        return raw_text, title, meta_description
+        extracted = extract_page(page, encoding)
+        return extracted['text'], extracted['title'], extracted['meta']
         
+    except (FetchRejected, ArchiveMiss) as e:
+        return f"[ERROR: {str(e)}]", "Untitled Page", ""
     except requests.exceptions.SSLError as e:
         return f"[ERROR: SSL Certificate verification failed: {str(e)}]", "Untitled Page", ""
     except requests.exceptions.ConnectionError as e:
@@ -521,7 +2000,122 @@ def get_webpage_text(url):
     except Exception as e:
         return f"[ERROR: {str(e)}]", "Untitled Page", ""
 
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+MC_FALLBACK_TAG = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+# Paragraphs are draft content when they sit directly in the document body,
+# a table cell or a text box
+DOCX_BLOCK_CONTAINERS = {WORD_NAMESPACE + 'body', WORD_NAMESPACE + 'tc', WORD_NAMESPACE + 'txbxContent'}
+# Run content that python-docx includes in a paragraph's text
+DOCX_RUN_TEXT_TAGS = {WORD_NAMESPACE + tag for tag in ['t', 'tab', 'ptab', 'br', 'cr', 'noBreakHyphen']}
+# Built-in styles whose styles.xml names python-docx reports capitalised
+DOCX_UI_STYLE_NAMES = {name.lower(): name for name in ['Caption', 'Footer', 'Header'] + [f'Heading {n}' for n in range(1, 10)]}
+
+def read_docx_style_names(archive):
+    """Return ({styleId: name} for paragraph styles, default paragraph style name)"""
+    root = ET.fromstring(archive.read('word/styles.xml'))
+    styles = {}
+    default_name = None
+    for style in root.iter(WORD_NAMESPACE + 'style'):
+        name_element = style.find(WORD_NAMESPACE + 'name')
+        name = name_element.get(WORD_NAMESPACE + 'val') if name_element is not None else None
+        name = DOCX_UI_STYLE_NAMES.get(name, name)
+        is_paragraph_style = style.get(WORD_NAMESPACE + 'type') == 'paragraph'
+        # The first style with an id wins, as in python-docx
+        styles.setdefault(style.get(WORD_NAMESPACE + 'styleId'), (is_paragraph_style, name))
+        if is_paragraph_style and style.get(WORD_NAMESPACE + 'default') in ('1', 'true', 'on'):
+            default_name = name
+    return {style_id: name for style_id, (is_paragraph_style, name) in styles.items() if is_paragraph_style}, default_name
+
+def read_docx_blocks(path):
+    """Return the text blocks of a DOCX file by streaming word/document.xml.
+
+    Produces what get_docx_text used to build with python-docx, one block per
+    non-empty paragraph with headings wrapped in <hN> tags, and also includes
+    the paragraphs of table cells and text boxes. Text box paragraphs follow
+    the paragraph they are anchored in; the VML fallback copy of a text box
+    is skipped. Only the elements of the paragraph being read are kept in
+    memory.
+    """
+    blocks = []
+    with zipfile.ZipFile(path) as archive:
+        style_names, default_style_name = read_docx_style_names(archive)
+        with archive.open('word/document.xml') as document:
+            path_tags = []  # Tags of the elements currently open
+            paragraphs = []  # Paragraphs currently open, innermost last
+            in_fallback = 0
+            for event, element in ET.iterparse(document, events=('start', 'end')):
+                if event == 'start':
+                    path_tags.append(element.tag)
+                    if element.tag == MC_FALLBACK_TAG:
+                        in_fallback += 1
+                    elif element.tag == WORD_NAMESPACE + 'p' and not in_fallback:
+                        parent = path_tags[-2] if len(path_tags) > 1 else None
+                        paragraphs.append({'depth': len(path_tags) - 1, 'parent': parent,
+                                           'text': [], 'style': None, 'nested': []})
+                    continue
+                
+                tag = path_tags.pop()
+                if tag == MC_FALLBACK_TAG:
+                    in_fallback -= 1
+                    element.clear()
+                    continue
+                if in_fallback or not paragraphs:
+                    continue
+                
+                paragraph = paragraphs[-1]
+                depth = paragraph['depth']
+                if tag in DOCX_RUN_TEXT_TAGS:
+                    # Only runs directly in the paragraph or in one of its hyperlinks count
+                    in_paragraph_run = path_tags[-1] == WORD_NAMESPACE + 'r' and (
+                        len(path_tags) == depth + 2 or
+                        (len(path_tags) == depth + 3 and path_tags[depth + 1] == WORD_NAMESPACE + 'hyperlink')
+                    )
+                    if in_paragraph_run:
+                        if tag == WORD_NAMESPACE + 't':
+                            paragraph['text'].append(element.text or '')
+                        elif tag == WORD_NAMESPACE + 'br':
+                            if element.get(WORD_NAMESPACE + 'type', 'textWrapping') == 'textWrapping':
+                                paragraph['text'].append('\n')
+                        elif tag == WORD_NAMESPACE + 'cr':
+                            paragraph['text'].append('\n')
+                        elif tag == WORD_NAMESPACE + 'noBreakHyphen':
+                            paragraph['text'].append('-')
+                        else:
+                            paragraph['text'].append('\t')
+                elif (tag == WORD_NAMESPACE + 'pStyle' and len(path_tags) == depth + 2 and
+                        path_tags[-1] == WORD_NAMESPACE + 'pPr'):
+                    paragraph['style'] = element.get(WORD_NAMESPACE + 'val')
+                elif tag == WORD_NAMESPACE + 'p' and len(path_tags) == depth:
+                    paragraphs.pop()
+                    paragraph_blocks = []
+                    text = ''.join(paragraph['text'])
+                    if paragraph['parent'] in DOCX_BLOCK_CONTAINERS and text.strip():
+                        style_name = style_names.get(paragraph['style'], default_style_name) or ''
+                        # Preserve formatting for headings
+                        if style_name.startswith('Heading'):
+                            paragraph_blocks.append(f"<h{style_name[-1]}>{text}</h{style_name[-1]}>")
+                        else:
+                            paragraph_blocks.append(text)
+                    paragraph_blocks.extend(paragraph['nested'])
+                    if paragraphs:
+                        paragraphs[-1]['nested'].extend(paragraph_blocks)
+                    else:
+                        blocks.extend(paragraph_blocks)
+                    element.clear()
+    return blocks
+
 def get_docx_text(path):
+    """Return the text of a DOCX draft as blocks separated by blank lines.
+
+    Uses read_docx_blocks unless the docx_fast_extraction setting is off or
+    the file cannot be read that way, in which case python-docx is used.
+    """
+    if load_settings()['docx_fast_extraction'].lower() == 'true':
+        try:
+            return "\n\n".join(read_docx_blocks(path))
+        except (KeyError, zipfile.BadZipFile, ET.ParseError):
+            pass  # Not a standard WordprocessingML package; let python-docx try
+    
     doc = Document(path)
     paragraphs = []
     for p in doc.paragraphs:
@@ -533,6 +2127,366 @@ def get_docx_text(path):
                 paragraphs.append(p.text)
     return "\n\n".join(paragraphs)
 
+# Bump whenever a change to DOCX extraction alters its output, so that
+# cached block lists from the old extractor are not reused
+DOCX_EXTRACTOR_VERSION = 1
+
+class DocxCache:
+    """Persistent cache of the normalized text blocks of DOCX drafts.
+
+    Block lists are stored once per file content, as <sha256>.<variant>.json
+    files, and an index maps each draft path to the size, mtime and content
+    key it had when it was last read. A draft whose size and mtime are
+    unchanged costs a single stat() call; one that was touched or copied
+    without changing its content is recognised by its hash instead of being
+    parsed again. The variant covers the extractor, so switching between
+    the fast reader and python-docx does not reuse the other's output.
+
+    Index changes are written every flush_every updates and by flush(), not
+    on each one. Drafts whose index entry was lost are still found by hash.
+    """
+
+    def __init__(self, directory, variant, flush_every=100):
+        self.directory = directory
+        self.variant = variant
+        self.flush_every = flush_every
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(directory, "index.json")
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+        self._blocks = {}
+
+    def get(self, path):
+        """Return the normalized blocks of the draft at path"""
+        blocks, identity = self.lookup(path)
+        if blocks is None:
+            blocks = extract_docx_blocks(path)
+            self.store(identity, blocks)
+        return blocks
+
+    def lookup(self, path):
+        """Return (blocks or None, identity) for the draft at path.
+
+        The identity is what store() needs to record freshly extracted
+        blocks for the same file.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        
+        entry = self._index.get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            blocks = self._load(entry['key'])
+            if blocks is not None:
+                return blocks, (path, stat, entry['key'])
+        
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        identity = (path, stat, f"{digest.hexdigest()}.{self.variant}")
+        
+        blocks = self._load(identity[2])
+        if blocks is not None:
+            self._update_index(identity)
+        return blocks, identity
+
+    def store(self, identity, blocks):
+        """Record the blocks extracted from the draft a lookup() missed"""
+        key = identity[2]
+        self._blocks[key] = list(blocks)
+        path = os.path.join(self.directory, key + ".json")
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(blocks, f)
+        os.replace(temp_path, path)
+        self._update_index(identity)
+
+    def _update_index(self, identity):
+        path, stat, key = identity
+        with self._lock:
+            self._index[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'key': key}
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._write_index()
+
+    def flush(self):
+        """Write any index changes that have not been saved yet"""
+        with self._lock:
+            if self._pending:
+                self._write_index()
+
+    def _write_index(self):
+        temp_path = self._index_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(temp_path, self._index_path)
+        self._pending = 0
+
+    def _load(self, key):
+        if not key.endswith("." + self.variant):
+            return None
+        if key not in self._blocks:
+            try:
+                with open(os.path.join(self.directory, key + ".json"), 'r', encoding='utf-8') as f:
+                    self._blocks[key] = json.load(f)
+            except (OSError, ValueError):
+                return None
+        return list(self._blocks[key])
+
+_docx_cache = None  # False once caching has been found to be disabled
+_docx_cache_lock = threading.Lock()
+
+def get_docx_cache():
+    """Return the shared DOCX cache, or None when it is disabled"""
+    global _docx_cache
+    if _docx_cache is None:
+        with _docx_cache_lock:
+            if _docx_cache is None:
+                settings = load_settings()
+                if settings['docx_cache_enabled'].lower() == 'true':
+                    reader = 'fast' if settings['docx_fast_extraction'].lower() == 'true' else 'python-docx'
+                    _docx_cache = DocxCache(get_cache_dir("docx"), f"v{DOCX_EXTRACTOR_VERSION}-{reader}")
+                    atexit.register(_docx_cache.flush)
+                else:
+                    _docx_cache = False
+    return _docx_cache or None
+
+def get_draft_patterns(value):
+    """Split a ';'-separated list of glob patterns from the settings"""
+    return [pattern.strip().lower() for pattern in value.split(';') if pattern.strip()]
+
+def matches_draft_pattern(relative_path, patterns):
+    """Check a '/'-separated path, or its file name alone, against glob patterns (case-insensitive)"""
+    relative_path = relative_path.lower()
+    name = relative_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatchcase(relative_path, pattern) or fnmatch.fnmatchcase(name, pattern)
+               for pattern in patterns)
+
+def discover_docx_files(roots, include=None, exclude=None):
+    """Yield the DOCX drafts among the given files and folders as they are found.
+
+    Folders are walked recursively with os.scandir, each folder's files
+    (in name order) before its subfolders. A draft must match one of the
+    include globs (default: the draft_include setting) and none of the
+    exclude globs (default: draft_exclude); patterns are matched against
+    the path relative to the folder and against the file name, ignoring
+    case. Subfolders matching an exclude glob are not entered, and Word
+    lock files (~$name.docx) are always skipped.
+    """
+    settings = load_settings()
+    include = get_draft_patterns(settings['draft_include']) if include is None else include
+    exclude = get_draft_patterns(settings['draft_exclude']) if exclude is None else exclude
+    
+    def is_draft(relative_path):
+        name = relative_path.rsplit('/', 1)[-1]
+        return (not name.startswith('~$') and matches_draft_pattern(relative_path, include) and
+                not matches_draft_pattern(relative_path, exclude))
+    
+    for root in roots:
+        if not os.path.isdir(root):
+            if is_draft(os.path.basename(root)):
+                yield root
+            continue
+        
+        stack = [(root, '')]
+        while stack:
+            directory, relative_directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = sorted(entries, key=lambda entry: entry.name.lower())
+            except OSError:
+                continue  # Unreadable folder
+            
+            subdirectories = []
+            for entry in entries:
+                relative_path = relative_directory + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not matches_draft_pattern(relative_path, exclude):
+                            subdirectories.append((entry.path, relative_path + '/'))
+                    elif entry.is_file() and is_draft(relative_path):
+                        yield entry.path
+                except OSError:
+                    continue
+            stack.extend(reversed(subdirectories))
+
+def extract_docx_blocks(path):
+    """Return the normalized text blocks of a DOCX draft, without caching"""
+    return split_into_blocks(normalize_text(get_docx_text(path)))
+
+def get_docx_blocks(path):
+    """Return the normalized text blocks of a DOCX draft, cached while the file is unchanged"""
+    cache = get_docx_cache()
+    if cache is None:
+        return extract_docx_blocks(path)
+    return cache.get(path)
+
+class DocxIngestion:
+    """Extracts DOCX drafts in the background while the caller does other work.
+
+    A lister thread takes paths from an iterable in order, so a generator
+    that is still discovering drafts can be passed in, and queues them for
+    a feeder thread. Drafts found in the DOCX cache are ready at once; the
+    others are extracted in a process pool, started on the first cache miss,
+    with at most max_in_flight of them submitted at a time so a huge folder
+    never queues all its work up front. Listing never waits for extraction,
+    so paths() returns as soon as discovery is done. get() waits for one
+    draft's blocks and raises the error its extraction failed with, if any.
+    With max_workers of 1 or less drafts are extracted on the feeder thread
+    instead.
+    """
+
+    def __init__(self, paths, max_workers, max_in_flight):
+        self._max_workers = max_workers
+        self._slots = threading.Semaphore(max_in_flight)
+        self._condition = threading.Condition()
+        self._results = {}  # path -> (blocks, error)
+        self._paths = []
+        self._fed = set()
+        self._queue = deque()
+        self._listing = True
+        self._closed = False
+        self._executor = None
+        self._lister = threading.Thread(target=self._list, args=(paths,), daemon=True)
+        self._thread = threading.Thread(target=self._feed, daemon=True)
+        self._lister.start()
+        self._thread.start()
+
+    def _list(self, paths):
+        try:
+            for path in paths:
+                with self._condition:
+                    if self._closed:
+                        break
+                    if path in self._fed:
+                        continue
+                    self._fed.add(path)
+                    self._paths.append(path)
+                    self._queue.append(path)
+                    self._condition.notify_all()
+        finally:
+            with self._condition:
+                self._listing = False
+                self._condition.notify_all()
+
+    def _feed(self):
+        cache = get_docx_cache()
+        while True:
+            with self._condition:
+                while not self._queue and self._listing and not self._closed:
+                    self._condition.wait()
+                if self._closed or not self._queue:
+                    break
+                path = self._queue.popleft()
+            
+            identity = None
+            try:
+                if cache is not None:
+                    blocks, identity = cache.lookup(path)
+                    if blocks is not None:
+                        self._finish(path, blocks)
+                        continue
+                if self._max_workers <= 1:
+                    self._finish(path, self._extract(identity, path))
+                    continue
+            except Exception as e:
+                self._finish(path, error=e)
+                continue
+            
+            self._slots.acquire()
+            with self._condition:
+                if self._closed:
+                    break
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self._max_workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                future = self._executor.submit(extract_docx_blocks, path)
+            future.add_done_callback(lambda future, path=path, identity=identity: self._collect(future, path, identity))
+
+    def _extract(self, identity, path):
+        blocks = extract_docx_blocks(path)
+        cache = get_docx_cache()
+        if cache is not None:
+            cache.store(identity, blocks)
+        return blocks
+
+    def _collect(self, future, path, identity):
+        self._slots.release()
+        if future.cancelled():
+            return
+        try:
+            blocks = future.result()
+            cache = get_docx_cache()
+            if cache is not None:
+                cache.store(identity, blocks)
+        except Exception as e:
+            self._finish(path, error=e)
+        else:
+            self._finish(path, blocks)
+
+    def _finish(self, path, blocks=None, error=None):
+        with self._condition:
+            self._results[path] = (blocks, error)
+            self._condition.notify_all()
+
+    def paths(self, on_wait=None):
+        """Wait until every path has been taken from the iterable and return them in order.
+
+        Only discovery is waited for, not extraction. If given, on_wait(found)
+        is called about ten times a second while waiting, with the number of
+        paths found so far, so a UI can keep itself up to date.
+        """
+        while True:
+            with self._condition:
+                if not self._listing:
+                    return list(self._paths)
+                self._condition.wait(0.1 if on_wait is not None else None)
+                found = len(self._paths)
+            if on_wait is not None:
+                on_wait(found)
+
+    def get(self, path):
+        """Wait for and return the normalized blocks of one of the drafts"""
+        with self._condition:
+            while path not in self._results:
+                if path not in self._fed and not self._listing:
+                    raise KeyError(f"Not one of the drafts being ingested: {path}")
+                self._condition.wait()
+            blocks, error = self._results[path]
+        if error is not None:
+            raise error
+        return list(blocks)
+
+    def close(self):
+        """Stop feeding, cancel any extraction that has not started yet and save the cache index"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            executor = self._executor
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        cache = get_docx_cache()
+        if cache is not None:
+            cache.flush()
+
+def start_docx_ingestion(paths):
+    """Start extracting drafts in the background using the docx_workers settings.
+
+    A docx_workers of 0 picks one worker per CPU, up to four.
+    """
+    settings = load_settings()
+    return DocxIngestion(
+        paths,
+        max_workers=int(settings['docx_workers']) or min(4, os.cpu_count() or 1),
+        max_in_flight=int(settings['docx_max_in_flight'])
+    )
+
 def normalize_text(text):
     # Only normalize whitespace and line breaks, preserve the rest
     text = re.sub(r"\r", "", text)
@@ -542,7 +2496,7 @@ def normalize_text(text):
 
 def normalize_html(text):
     # First, preserve link text by unwrapping anchor tags
-    soup = BeautifulSoup(text, 'html.parser')
+    soup = make_soup(text)
     for a in soup.find_all('a'):
         a.unwrap()
     text = str(soup)
@@ -560,103 +2514,239 @@ def normalize_html(text):
 def split_into_blocks(text):
     return [block.strip() for block in text.split("\n\n") if block.strip()]
 
-def block_compare(draft, live, similarity_threshold=0.9):
+BLOCK_INDEX_GRAM_SIZE = 3
+
+def get_block_grams(text):
+    """Return the set of lowercase character n-grams of a block"""
+    text = text.lower()
+    if len(text) < BLOCK_INDEX_GRAM_SIZE:
+        return {text}
+    return {text[i:i + BLOCK_INDEX_GRAM_SIZE] for i in range(len(text) - BLOCK_INDEX_GRAM_SIZE + 1)}
+
+class BlockCandidateIndex:
+    """Inverted index from character n-grams to the blocks containing them.
+
+    Used by block_compare to pick the few live blocks worth an exact
+    SequenceMatcher ratio: candidates() ranks blocks by the Dice overlap of
+    their n-gram sets with a draft block and returns the best k, in document
+    order so that ties between equal scores resolve as in a full scan.
+    """
+
+    def __init__(self, blocks):
+        self._postings = defaultdict(list)
+        self._sizes = {}
+        for index, block in blocks:
+            grams = get_block_grams(block)
+            self._sizes[index] = len(grams)
+            for gram in grams:
+                self._postings[gram].append(index)
+
+    def candidates(self, block, k, skip):
+        """Return up to k indices of blocks sharing n-grams with block, leaving out those skip() rejects"""
+        grams = get_block_grams(block)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        overlap = {
+            index: 2 * count / (len(grams) + self._sizes[index])
+            for index, count in shared.items() if not skip(index)
+        }
+        return sorted(heapq.nlargest(k, overlap, key=lambda index: (overlap[index], -index)))
+
+EXACT_MATCH_TYPES = ['heading', 'page_name', 'internal_ref', 'page_link', 'meta_title', 'meta_desc']
+
+def get_block_content_type(text):
+    if text.startswith('Page Name:'):
+        return 'page_name'
+    elif text.startswith('Internal Reference:'):
+        return 'internal_ref'
+    elif text.startswith('Page Link:'):
+        return 'page_link'
+    elif text.startswith('Meta Title:'):
+        return 'meta_title'
+    elif text.startswith('Meta Description:'):
+        return 'meta_desc'
+    elif any(text.startswith(f'<h{i}>') for i in range(1, 7)):
+        return 'heading'
+    return 'content'
+
+class Block:
+    """A draft or live block with what block_compare needs from its text worked out once.
+
+    Blocks are told apart by their index, so repeated identical paragraphs
+    are matched one by one. The character counts used for the quick_ratio
+    bound are only built if a comparison gets that far.
+    """
+
+    __slots__ = ('index', 'text', 'content_type', 'clean_text', 'sentences', 'length', 'hash', '_char_counts')
+
+    def __init__(self, index, text):
+        self.index = index
+        self.text = text
+        self.content_type = get_block_content_type(text)
+        
+        # Headings and metadata are compared without HTML tags, and headings
+        # and page names without a "Page Name:" prefix
+        clean_text = text
+        if self.content_type in EXACT_MATCH_TYPES:
+            clean_text = re.sub(r'<[^>]+>', '', text)
+            if self.content_type in ['page_name', 'heading']:
+                clean_text = clean_text.replace('Page Name:', '').strip()
+        self.clean_text = clean_text
+        
+        self.sentences = [s.strip() for s in text.split('.') if s.strip()]
+        self.length = len(text)
+        self.hash = hash(text)
+        self._char_counts = None
+
+    @property
+    def char_counts(self):
+        if self._char_counts is None:
+            self._char_counts = Counter(self.text)
+        return self._char_counts
+
+def calculate_similarity(block1, block2, at_least=0.0, above=-1.0, stats=None):
+    """Similarity of two Blocks, or None when it is certainly below at_least or not above `above`.
+
+    For content blocks the score is bounded before the full ratio is
+    computed: first by the lengths alone (what real_quick_ratio() gives,
+    without building a matcher), then by the shared character counts (what
+    quick_ratio() gives). Pairs that cannot reach the cutoff are skipped, so
+    the scores that are returned are unchanged. If a stats Counter is given,
+    the content pair is counted under 'pairs' and under the tier that
+    decided it: 'identical', 'length_bound', 'quick_ratio' or 'ratio'.
+    """
+    # If types don't match, they're not similar
+    if block1.content_type != block2.content_type:
+        return 0.0
+    
+    # For headings and metadata, require exact matches after stripping HTML tags
+    if block1.content_type in EXACT_MATCH_TYPES:
+        return 1.0 if block1.clean_text == block2.clean_text else 0.0
+    
+    if stats is not None:
+        stats['pairs'] += 1
+    if block1.hash == block2.hash and block1.text == block2.text:
+        if stats is not None:
+            stats['identical'] += 1
+        return 1.0
+    
+    total_length = block1.length + block2.length
+    length_bound = 2.0 * min(block1.length, block2.length) / total_length
+    if length_bound < at_least or length_bound <= above:
+        if stats is not None:
+            stats['length_bound'] += 1
+        return None
+    
+    shared_chars = sum((block1.char_counts & block2.char_counts).values())
+    quick_bound = 2.0 * shared_chars / total_length
+    if quick_bound < at_least or quick_bound <= above:
+        if stats is not None:
+            stats['quick_ratio'] += 1
+        return None
+    
+    # For regular content, use sequence matcher with high threshold
+    if stats is not None:
+        stats['ratio'] += 1
+    return difflib.SequenceMatcher(None, block1.text, block2.text).ratio()
+
+def format_similarity_stats(stats):
+    """Describe how the content pairs counted in a stats Counter were decided"""
+    pairs = stats['pairs']
+    if not pairs:
+        return "No content blocks needed scoring."
+    return (f"{pairs} content block pairs scored: {stats['identical']} identical, "
+            f"{stats['length_bound']} ruled out by length, {stats['quick_ratio']} by shared characters, "
+            f"{stats['ratio']} needed the full comparison ({stats['ratio'] / pairs:.1%}).")
+
+def block_compare(draft, live, similarity_threshold=0.9, exact=False, candidate_count=20, stats=None):
+    """Align draft blocks with live blocks and return (aligned, similarity).
+
+    The best-match search for each draft block, and the check whether a
+    skipped live block matches a later draft block, only score blocks that
+    can plausibly match: exact-match types (headings and metadata) are
+    looked up by their cleaned text, and regular content goes through a
+    BlockCandidateIndex keeping the candidate_count best candidates. With
+    exact every block is scored, as a reference for checking the index. If a stats Counter is given, the
+    pairs scored by these two searches are added to it (see
+    calculate_similarity); placing leftover live blocks is not counted.
+    """
     # Split into blocks while preserving paragraph structure
-    draft_blocks = split_into_blocks(draft)
-    live_blocks = split_into_blocks(live)
+    draft_blocks = [Block(index, text) for index, text in enumerate(split_into_blocks(draft))]
+    live_blocks = [Block(index, text) for index, text in enumerate(split_into_blocks(live))]
     
     # Find the first H1 in both draft and live content
-    draft_h1_index = next((i for i, block in enumerate(draft_blocks) if block.startswith('<h1>')), -1)
-    live_h1_index = next((i for i, block in enumerate(live_blocks) if block.startswith('<h1>')), -1)
+    draft_h1_index = next((block.index for block in draft_blocks if block.text.startswith('<h1>')), -1)
+    live_h1_index = next((block.index for block in live_blocks if block.text.startswith('<h1>')), -1)
     
     # Track total content and matched content for similarity calculation
-    total_draft_length = sum(len(block) for block in draft_blocks[draft_h1_index:]) if draft_h1_index != -1 else sum(len(block) for block in draft_blocks)
-    total_live_length = sum(len(block) for block in live_blocks[live_h1_index:]) if live_h1_index != -1 else sum(len(block) for block in live_blocks)
+    total_draft_length = sum(block.length for block in draft_blocks[draft_h1_index:]) if draft_h1_index != -1 else sum(block.length for block in draft_blocks)
+    total_live_length = sum(block.length for block in live_blocks[live_h1_index:]) if live_h1_index != -1 else sum(block.length for block in live_blocks)
     matched_content_length = 0
     
     # Initialize aligned results list
     aligned = []
-    matched_live = set()
-
-    def is_heading(text):
-        return any(text.startswith(f'<h{i}>') for i in range(1, 7))
-
-    def get_content_type(text):
-        if text.startswith('Page Name:'):
-            return 'page_name'
-        elif text.startswith('Internal Reference:'):
-            return 'internal_ref'
-        elif text.startswith('Page Link:'):
-            return 'page_link'
-        elif text.startswith('Meta Title:'):
-            return 'meta_title'
-        elif text.startswith('Meta Description:'):
-            return 'meta_desc'
-        elif is_heading(text):
-            return 'heading'
-        return 'content'
-
-    def calculate_similarity(text1, text2):
-        type1 = get_content_type(text1)
-        type2 = get_content_type(text2)
-        
-        # If types don't match, they're not similar
-        if type1 != type2:
-            return 0.0
-        
-        # For headings and metadata, require exact matches after stripping HTML tags
-        if type1 in ['heading', 'page_name', 'internal_ref', 'page_link', 'meta_title', 'meta_desc']:
-            # Strip HTML tags for comparison
-            clean1 = re.sub(r'<[^>]+>', '', text1)
-            clean2 = re.sub(r'<[^>]+>', '', text2)
-            
-            # For page names and headings, strip the prefix
-            if type1 in ['page_name', 'heading']:
-                clean1 = clean1.replace('Page Name:', '').strip()
-                clean2 = clean2.replace('Page Name:', '').strip()
-            
-            # Exact match required for these types
-            return 1.0 if clean1 == clean2 else 0.0
-        
-        # For regular content, use sequence matcher with high threshold
-        return difflib.SequenceMatcher(None, text1, text2).ratio()
+    live_matched = [False] * len(live_blocks)
+    
+    def build_candidate_lookups(blocks):
+        # Headings and metadata by type and cleaned text, content by its n-grams
+        exact_match_blocks = defaultdict(list)
+        for block in blocks:
+            if block.content_type != 'content':
+                exact_match_blocks[(block.content_type, block.clean_text)].append(block.index)
+        content_index = BlockCandidateIndex(
+            (block.index, block.text) for block in blocks if block.content_type == 'content'
+        )
+        return exact_match_blocks, content_index
+    
+    def find_candidates(block, blocks, lookups, skip):
+        """Indices of the blocks worth scoring against block, in document order"""
+        if exact:
+            return [index for index in range(len(blocks)) if not skip(index)]
+        exact_match_blocks, content_index = lookups
+        if block.content_type == 'content':
+            return content_index.candidates(block.text, candidate_count, skip)
+        return [index for index in exact_match_blocks.get((block.content_type, block.clean_text), [])
+                if not skip(index)]
+    
+    live_lookups = build_candidate_lookups(live_blocks)
+    draft_lookups = build_candidate_lookups(draft_blocks)
     
     # First pass: try to match blocks with high similarity
     for i, db in enumerate(draft_blocks):
         best_match = None
         best_score = 0
-        best_index = -1
         
         # Try to find the best matching block in live content
-        for j, lb in enumerate(live_blocks):
-            if lb in matched_live:
-                continue
+        for j in find_candidates(db, live_blocks, live_lookups, lambda j: live_matched[j]):
+            lb = live_blocks[j]
             
-            score = calculate_similarity(db, lb)
-            if score > best_score:
+            # Only a score that beats the best so far and reaches the threshold matters
+            score = calculate_similarity(db, lb, at_least=similarity_threshold, above=best_score, stats=stats)
+            if score is not None and score > best_score:
                 best_score = score
                 best_match = lb
-                best_index = j
         
         # If we have a good match, use it
         if best_score >= similarity_threshold:
-            matched_live.add(best_match)
+            live_matched[best_match.index] = True
             # Add any unmatched live blocks that come before this match
-            for k in range(best_index):
-                if live_blocks[k] not in matched_live:
+            for lb in live_blocks[:best_match.index]:
+                if not live_matched[lb.index]:
                     # Check if this block has higher similarity with any upcoming draft blocks
                     future_match = False
-                    for future_db in draft_blocks[i+1:]:
-                        future_score = calculate_similarity(future_db, live_blocks[k])
-                        if future_score >= similarity_threshold:
+                    for future_index in find_candidates(lb, draft_blocks, draft_lookups, lambda index: index <= i):
+                        future_score = calculate_similarity(draft_blocks[future_index], lb,
+                                                            at_least=similarity_threshold, stats=stats)
+                        if future_score is not None and future_score >= similarity_threshold:
                             future_match = True
                             break
                     if not future_match:
-                        aligned.append(("current", "", live_blocks[k]))
-                        matched_live.add(live_blocks[k])
+                        aligned.append(("current", "", lb.text))
+                        live_matched[lb.index] = True
             
-            aligned.append(("matched", db, best_match))
-            matched_content_length += len(db) * best_score
+            aligned.append(("matched", db.text, best_match.text))
+            matched_content_length += db.length * best_score
         else:
             # If no good match, check for partial matches
             partial_matches = []
@@ -664,21 +2754,18 @@ def block_compare(draft, live, similarity_threshold=0.9):
             best_partial_index = -1
             
             # Skip partial matching for headings and metadata
-            if get_content_type(db) not in ['heading', 'page_name', 'internal_ref', 'page_link', 'meta_title', 'meta_desc']:
-                for j, lb in enumerate(live_blocks):
-                    if lb in matched_live:
+            if db.content_type not in EXACT_MATCH_TYPES:
+                for lb in live_blocks:
+                    if live_matched[lb.index]:
                         continue
                     # Skip partial matching if types don't match
-                    if get_content_type(db) != get_content_type(lb):
+                    if db.content_type != lb.content_type:
                         continue
                     
-                    # Split into sentences and check for partial matches
-                    live_sentences = [s.strip() for s in lb.split('.') if s.strip()]
-                    draft_sentences = [s.strip() for s in db.split('.') if s.strip()]
-                    
+                    # Check the sentences for partial matches
                     sentence_matches = []
-                    for ds in draft_sentences:
-                        for ls in live_sentences:
+                    for ds in db.sentences:
+                        for ls in lb.sentences:
                             match_score = difflib.SequenceMatcher(None, ds, ls).ratio()
                             if match_score > 0.8:  # Lower threshold for partial matches
                                 sentence_matches.append((ds, ls, match_score))
@@ -687,26 +2774,38 @@ def block_compare(draft, live, similarity_threshold=0.9):
                     if sentence_matches:
                         partial_matches.extend(sentence_matches)
                         if best_partial_index == -1:
-                            best_partial_index = j
+                            best_partial_index = lb.index
             
             if partial_matches:
                 # Add any unmatched live blocks that come before this partial match
-                for k in range(best_partial_index):
-                    if live_blocks[k] not in matched_live:
-                        aligned.append(("current", "", live_blocks[k]))
-                        matched_live.add(live_blocks[k])
+                for lb in live_blocks[:best_partial_index]:
+                    if not live_matched[lb.index]:
+                        aligned.append(("current", "", lb.text))
+                        live_matched[lb.index] = True
                 
-                # Combine partial matches
+                # Combine partial matches; when they add up to a whole live
+                # block, that block is used up
                 combined_live = " ".join(m[1] for m in partial_matches)
-                matched_live.add(combined_live)
-                aligned.append(("matched", db, combined_live))
+                for lb in live_blocks:
+                    if not live_matched[lb.index] and lb.text == combined_live:
+                        live_matched[lb.index] = True
+                        break
+                aligned.append(("matched", db.text, combined_live))
                 matched_content_length += partial_match_length
             else:
-                aligned.append(("missing", db, ""))
+                aligned.append(("missing", db.text, ""))
+    
+    # Aligned entries hold text; context scoring needs the matching Blocks
+    blocks_by_text = {block.text: block for block in draft_blocks + live_blocks}
+    
+    def get_block(text):
+        if text not in blocks_by_text:
+            blocks_by_text[text] = Block(-1, text)
+        return blocks_by_text[text]
     
     # Add any remaining unmatched live blocks at their relative positions
-    for i, lb in enumerate(live_blocks):
-        if lb not in matched_live:
+    for lb in live_blocks:
+        if not live_matched[lb.index]:
             # Try to find the best position based on similarity with surrounding content
             best_pos = len(aligned)
             best_context_score = 0
@@ -717,20 +2816,20 @@ def block_compare(draft, live, similarity_threshold=0.9):
                 if pos > 0:
                     prev_content = aligned[pos-1][1] or aligned[pos-1][2]  # Use draft or live content
                     if prev_content:
-                        context_score += calculate_similarity(prev_content, lb)
+                        context_score += calculate_similarity(get_block(prev_content), lb)
                 
                 # Check similarity with next block
                 if pos < len(aligned):
                     next_content = aligned[pos][1] or aligned[pos][2]  # Use draft or live content
                     if next_content:
-                        context_score += calculate_similarity(next_content, lb)
+                        context_score += calculate_similarity(get_block(next_content), lb)
                 
                 if context_score > best_context_score:
                     best_context_score = context_score
                     best_pos = pos
             
             # Insert at best position
-            aligned.insert(best_pos, ("current", "", lb))
+            aligned.insert(best_pos, ("current", "", lb.text))
     
     # Calculate similarity score
     if total_draft_length == 0 or total_live_length == 0:
@@ -745,7 +2844,7 @@ def block_compare(draft, live, similarity_threshold=0.9):
     
     return aligned, similarity
 
-def format_result_as_html(docx_file, url, title, meta_desc, similarity, results):
+def format_result_as_html(docx_file, url, title, meta_desc, similarity, results, encoding=None):
     # Add title and color key
     report = """
     <div class='report-container'>
@@ -767,6 +2866,7 @@ def format_result_as_html(docx_file, url, title, meta_desc, similarity, results)
             <p><strong>URL:</strong> <a href='{url}' target='_blank'>{url}</a></p>
             <p><strong>Page Title:</strong> {title}</p>
             <p><strong>Meta Description:</strong> {meta_desc}</p>
+            {encoding_info}
             <p><strong>Similarity Score:</strong> {similarity:.2%}</p>
             {similarity_indicator}
         </div>
@@ -782,6 +2882,7 @@ def format_result_as_html(docx_file, url, title, meta_desc, similarity, results)
         url=url,
         title=title,
         meta_desc=meta_desc,
+        encoding_info=f"<p><strong>Page Encoding:</strong> {encoding}</p>" if encoding else "",
         similarity=similarity,
         similarity_indicator="""
             <p class='similarity-high' style='color: #28a745;'>✅ Content is mostly identical.</p>
@@ -939,10 +3040,12 @@ def format_result_as_html(docx_file, url, title, meta_desc, similarity, results)
     
     return report
 
-def format_result_as_markdown(docx_file, url, title, meta_desc, similarity, results):
+def format_result_as_markdown(docx_file, url, title, meta_desc, similarity, results, encoding=None):
     report = f"## {docx_file} vs {url}\n"
     report += f"**Page Title**: {title}\n\n"
     report += f"**Meta Description**: {meta_desc}\n\n"
+    if encoding:
+        report += f"**Page Encoding**: {encoding}\n\n"
     report += f"**Similarity Score**: `{similarity:.2%}`\n\n"
     if similarity > 0.95:
         report += "✅ Content is mostly identical.\n\n"
@@ -992,35 +3095,23 @@ def handle_drop(event):
     if current_path:
         paths.append(current_path)
     
-    # Collect all DOCX files
-    docx_files = []
-    for path in paths:
-        # Remove quotes if present
-        path = path.strip('"')
-        
-        if os.path.isdir(path):
-            # If it's a directory, find all DOCX files in it
-            docx_files.extend([
-                os.path.join(path, f) 
-                for f in os.listdir(path) 
-                if f.lower().endswith('.docx')
-            ])
-        elif path.lower().endswith('.docx'):
-            # If it's a DOCX file, add it directly
-            docx_files.append(path)
+    # Collect all DOCX files, including those in subfolders; the rest of the
+    # tree is discovered while the first drafts are already being extracted
+    docx_files = discover_docx_files([path.strip('"') for path in paths])
+    first_file = next(docx_files, None)
     
-    if not docx_files:
+    if first_file is None:
         messagebox.showerror("Error", "No .docx files found in the dropped items.")
         return
     
     # Create a results folder
-    first_file_dir = os.path.dirname(docx_files[0])
+    first_file_dir = os.path.dirname(first_file)
     results_folder = os.path.join(first_file_dir, "VerbatimAI_Results")
     if not os.path.exists(results_folder):
         os.makedirs(results_folder)
     
     # Process the files
-    process_files(results_folder, docx_files)
+    process_files(results_folder, itertools.chain([first_file], docx_files))
 
 def run_batch_comparison(folder=None):
     """Run comparison for files selected through folder, multiple files, or single file"""
@@ -1161,28 +3252,46 @@ def run_batch_comparison(folder=None):
     process_files(folder)
 
 def process_files(folder, specific_files=None):
-    """Process the selected files for comparison"""
+    """Process the selected files for comparison.
+
+    specific_files may be any iterable of paths, including a generator that
+    is still discovering them.
+    """
     # Get DOCX files based on selection method
     if specific_files:
         # Store original file paths and use them directly
-        docx_files = specific_files
+        draft_paths = specific_files
     else:
-        # Get full paths for files in the folder
-        docx_files = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.docx')]
+        # Find the drafts in the folder and its subfolders
+        draft_paths = discover_docx_files([folder])
+
+    # Drafts are extracted in the background, starting as soon as they are
+    # found, while URLs are matched and pages fetched. Only the listing is
+    # waited for here; the window keeps repainting meanwhile
+    def show_found(found):
+        text_area.delete(1.0, tk.END)
+        text_area.insert(tk.END, f"Looking for drafts... {found} found")
+        root.update_idletasks()
+    
+    ingestion = start_docx_ingestion(draft_paths)
+    docx_files = ingestion.paths(on_wait=show_found)
 
     if not docx_files:
+        ingestion.close()
         messagebox.showerror("Error", "No .docx files found in the selected location.")
         return
 
-    # Create a results folder
-    first_file_dir = os.path.dirname(docx_files[0])
-    results_folder = os.path.join(first_file_dir, "VerbatimAI_Results")
+    # Create a results folder in the selected folder; drafts are found in
+    # its subfolders too, so the first one may be further down the tree
+    results_parent = os.path.dirname(docx_files[0]) if specific_files else folder
+    results_folder = os.path.join(results_parent, "VerbatimAI_Results")
     if not os.path.exists(results_folder):
         os.makedirs(results_folder)
 
     # Create URL matching window
-    matches = get_document_url_pairs(docx_files, root)
+    matches = get_document_url_pairs(docx_files, root, ingestion)
     if not matches:
+        ingestion.close()
         return
 
     # Disable the main window's drop target while processing
@@ -1193,26 +3302,41 @@ def process_files(folder, specific_files=None):
         total = len(matches)
         progress_bar["maximum"] = total
         progress_bar["value"] = 0
-        report_md = "# Batch Comparison Report\n\n"
-        summary = []
+        # Report sections are collected per match so the markdown keeps the
+        # original order even though pages arrive in completion order
+        report_sections = [""] * total
+        summary_lines = [None] * total
+        completed = 0
+        compare_stats = Counter()
+        settings = load_settings()
+        compare_exact = settings['compare_exact'].lower() == 'true'
+        candidate_count = int(settings['compare_candidates'])
         
-        for i, (docx_file, url) in enumerate(matches, start=1):
+        for index, (live_text, title, meta_desc), page_info in fetch_webpages([url for _, url in matches]):
+            i = index + 1
+            docx_file, url = matches[index]
             try:
                 # Use the full path for processing
-                draft_text = normalize_text(get_docx_text(docx_file))
-                live_text, title, meta_desc = get_webpage_text(url)
+                draft_text = "\n\n".join(ingestion.get(docx_file))
                 live_text = normalize_text(live_text)
                 
                 if "[ERROR" in live_text:
-                    report_md += f"## {os.path.basename(docx_file)} vs {url}\n❌ {live_text}\n\n"
-                    summary.append(f"❌ {url}: Error")
+                    report_sections[index] = f"## {os.path.basename(docx_file)} vs {url}\n❌ {live_text}\n\n"
+                    summary_lines[index] = f"❌ {url}: Error"
                     continue
                 
-                diff, similarity = block_compare(draft_text, live_text)
+                if load_settings()['boilerplate_enabled'].lower() == 'true':
+                    live_text = strip_boilerplate(live_text, page_info.get('url', url), draft_text)
+                
+                diff, similarity = block_compare(draft_text, live_text, exact=compare_exact,
+                                                 candidate_count=candidate_count, stats=compare_stats)
                 
                 # Generate reports using basename for display
-                html_report = format_result_as_html(os.path.basename(docx_file), url, title, meta_desc, similarity, diff)
-                markdown_report = format_result_as_markdown(os.path.basename(docx_file), url, title, meta_desc, similarity, diff)
+                encoding = page_info.get('encoding')
+                if encoding:
+                    encoding = f"{encoding} ({page_info['encoding_source']})"
+                html_report = format_result_as_html(os.path.basename(docx_file), url, title, meta_desc, similarity, diff, encoding)
+                markdown_report = format_result_as_markdown(os.path.basename(docx_file), url, title, meta_desc, similarity, diff, encoding)
 
                 # Save HTML report
                 html_file_path = os.path.join(results_folder, f"report_{i}_{os.path.splitext(os.path.basename(docx_file))[0]}.html")
@@ -1263,15 +3387,20 @@ def process_files(folder, specific_files=None):
                     <body>{html_report}</body>
                 </html>""")
 
-                report_md += markdown_report
-                summary.append(f"{url} → Similarity: {similarity:.2%}")
+                report_sections[index] = markdown_report
+                summary_lines[index] = f"{url} → Similarity: {similarity:.2%}"
 
             except Exception as e:
-                report_md += f"## {os.path.basename(docx_file)} vs {url}\n❌ Error: {str(e)}\n\n"
-                summary.append(f"❌ {url}: Error")
-            
-            progress_bar["value"] = i
-            root.update_idletasks()
+                report_sections[index] = f"## {os.path.basename(docx_file)} vs {url}\n❌ Error: {str(e)}\n\n"
+                summary_lines[index] = f"❌ {url}: Error"
+            finally:
+                completed += 1
+                progress_bar["value"] = completed
+                root.update_idletasks()
+        
+        stats_line = format_similarity_stats(compare_stats)
+        report_md = "# Batch Comparison Report\n\n" + "".join(report_sections) + f"## Comparison Statistics\n{stats_line}\n"
+        summary = [line for line in summary_lines if line is not None] + ["", stats_line]
         
         # Save markdown report
         md_path = os.path.join(results_folder, "comparison_report.md")
@@ -1406,6 +3535,8 @@ def process_files(folder, specific_files=None):
         progress_bar["value"] = 0
     
     finally:
+        ingestion.close()
+        
         # Re-enable the drop target
         if USE_DND:
             drop_target.drop_target_register(tkdnd.DND_FILES)
@@ -1501,7 +3632,49 @@ def load_settings():
     settings = {
         'default_save_location': downloads_path,
         'similarity_threshold': '0.9',
-        'dark_mode': 'false'
+        'dark_mode': 'false',
+        'http_pool_connections': '10',
+        'http_pool_maxsize': '10',
+        'http_timeout': '30',
+        'http_max_redirects': '5',
+        'http_headers': '',
+        'fetch_max_workers': '8',
+        'fetch_per_host': '4',
+        'fetch_max_per_host': '16',
+        'http_retries': '3',
+        'retry_backoff': '1',
+        'retry_max_delay': '60',
+        'crawl_workers': '5',
+        'crawl_rate': '5',
+        'crawl_burst': '5',
+        'sitemap_max_urls': '5000',
+        'crawl_snapshot_enabled': 'true',
+        'max_page_size_mb': '10',
+        'fetch_archive_mode': 'off',
+        'fetch_archive_path': '',
+        'html_parser': 'auto',
+        'docx_fast_extraction': 'true',
+        'draft_include': '*.docx',
+        'draft_exclude': '',
+        'docx_cache_enabled': 'true',
+        'compare_candidates': '20',
+        'compare_exact': 'false',
+        'docx_workers': '0',
+        'docx_max_in_flight': '8',
+        'streaming_extraction': 'false',
+        'extract_cache_enabled': 'true',
+        'extract_cache_entries': '256',
+        'extract_cache_disk': 'false',
+        'extract_cache_disk_entries': '5000',
+        'extraction_profiles_path': '',
+        'boilerplate_enabled': 'true',
+        'boilerplate_min_share': '0.6',
+        'boilerplate_min_pages': '5',
+        'cache_location': '',
+        'http_cache_enabled': 'true',
+        'http_cache_ttl': '600',
+        'http_cache_max_mb': '500',
+        'http_cache_force_refresh': 'false'
     }
     
     settings_file = os.path.join(os.path.dirname(__file__), "config", "settings.txt")
@@ -1733,6 +3906,10 @@ def show_settings():
     
     ttk.Button(general_frame, text="Browse...", command=browse_save_location).pack(anchor='w', padx=10)
     
+    force_refresh_var = tk.BooleanVar(value=current_settings['http_cache_force_refresh'].lower() == 'true')
+    ttk.Checkbutton(general_frame, text="Always re-download live pages (ignore cache)",
+                    variable=force_refresh_var).pack(anchor='w', padx=10, pady=10)
+    
     ttk.Label(comparison_frame, text="Similarity Threshold:").pack(anchor='w', padx=10, pady=5)
     similarity_scale = ttk.Scale(comparison_frame, from_=0.5, to=1.0, orient='horizontal')
     similarity_scale.set(float(current_settings['similarity_threshold']))
@@ -1740,10 +3917,12 @@ def show_settings():
     
     def save_and_close():
         # Save settings
-        new_settings = {
+        new_settings = dict(current_settings)
+        new_settings.update({
             'default_save_location': save_location.get(),
-            'similarity_threshold': str(similarity_scale.get())
-        }
+            'similarity_threshold': str(similarity_scale.get()),
+            'http_cache_force_refresh': str(force_refresh_var.get()).lower()
+        })
         save_settings(new_settings)
         settings_window.destroy()
     
@@ -1865,12 +4044,157 @@ def show_about():
     # Add close button
     ttk.Button(about_window, text="Close", command=about_window.destroy).pack(pady=10)
 
-def crawl_website(base_url, max_pages=100):
-    """Crawl a website starting from base_url and extract URLs with their content"""
+def discover_sitemap_urls(base_url, sitemap_urls, limit=5000):
+    """Collect page URLs for the site from its sitemaps.
+
+    Follows sitemap indexes and reads gzip-compressed sitemaps. Returns a dict
+    mapping each page URL on the site's domain to its <lastmod> value (or
+    None), in sitemap order, with at most `limit` entries.
+    """
+    site_host = urllib.parse.urlparse(base_url).netloc.lower()
+    if site_host.startswith('www.'):
+        site_host = site_host[4:]
+
+    def same_site(url):
+        host = urllib.parse.urlparse(url).netloc.lower()
+        return (host[4:] if host.startswith('www.') else host) == site_host
+
+    pages = {}
+    pending = deque(sitemap_urls)
+    seen_sitemaps = set()
+    while pending and len(pages) < limit:
+        sitemap_url = pending.popleft()
+        if sitemap_url in seen_sitemaps:
+            continue
+        seen_sitemaps.add(sitemap_url)
+
+        try:
+            body = fetch_page(sitemap_url)['body']
+            # .xml.gz files are usually served as-is rather than with
+            # Content-Encoding, so they still need to be decompressed here
+            if body[:2] == b'\x1f\x8b':
+                body = gzip.decompress(body)
+            tree = ET.fromstring(body)
+        except Exception as e:
+            print(f"Error reading sitemap {sitemap_url}: {str(e)}")
+            continue
+
+        # Sitemaps are namespaced; match on the local tag name only
+        root_tag = tree.tag.rsplit('}', 1)[-1]
+        for entry in tree:
+            fields = {child.tag.rsplit('}', 1)[-1]: (child.text or '').strip() for child in entry}
+            loc = fields.get('loc')
+            if not loc:
+                continue
+            if root_tag == 'sitemapindex':
+                pending.append(loc)
+            elif same_site(loc) and len(pages) < limit:
+                pages[loc] = fields.get('lastmod') or None
+    return pages
+
+def get_site_key(url):
+    """Return the host of a URL without any leading "www." """
+    if '://' not in url:
+        url = 'https://' + url
+    host = urllib.parse.urlparse(url).hostname or ''
+    return host[4:] if host.startswith('www.') else host
+
+def get_block_fingerprint(block):
+    return hashlib.sha1(block.encode('utf-8')).hexdigest()
+
+def find_boilerplate_blocks(page_contents, min_share, min_pages):
+    """Return fingerprints of the blocks found on more than min_share of the crawled pages.
+
+    Sites with fewer than min_pages crawled pages are too small to tell
+    boilerplate from content, so nothing is reported for them.
+    """
+    if len(page_contents) < min_pages:
+        return set()
+    
+    page_counts = Counter()
+    for data in page_contents.values():
+        page_counts.update({get_block_fingerprint(block) for block in split_into_blocks(normalize_text(data['content']))})
+    return {fingerprint for fingerprint, count in page_counts.items() if count / len(page_contents) > min_share}
+
+def remove_boilerplate_blocks(text, boilerplate, keep_blocks=()):
+    """Drop boilerplate blocks from text, except any that are listed in keep_blocks"""
+    keep_blocks = set(keep_blocks)
+    return "\n\n".join(
+        block for block in split_into_blocks(normalize_text(text))
+        if block in keep_blocks or get_block_fingerprint(block) not in boilerplate
+    )
+
+_site_boilerplate = {}
+
+def get_boilerplate_path(site):
+    safe_name = re.sub(r'[^A-Za-z0-9.-]', '_', site)
+    return os.path.join(get_cache_dir("crawl"), safe_name + ".boilerplate.json")
+
+def save_site_boilerplate(site, boilerplate):
+    """Remember the boilerplate block fingerprints found while crawling a site"""
+    _site_boilerplate[site] = set(boilerplate)
+    with open(get_boilerplate_path(site), 'w', encoding='utf-8') as f:
+        json.dump(sorted(boilerplate), f)
+
+def load_site_boilerplate(site):
+    """Return the boilerplate fingerprints known for a site (empty if never crawled)"""
+    if site not in _site_boilerplate:
+        try:
+            with open(get_boilerplate_path(site), 'r', encoding='utf-8') as f:
+                _site_boilerplate[site] = set(json.load(f))
+        except (OSError, ValueError):
+            _site_boilerplate[site] = set()
+    return _site_boilerplate[site]
+
+def strip_boilerplate(live_text, url, draft_text=""):
+    """Remove the site's known boilerplate blocks from a live page's text.
+
+    Blocks that also appear in the draft are kept so that they are still
+    reported as matched.
+    """
+    boilerplate = load_site_boilerplate(get_site_key(url))
+    if not boilerplate:
+        return live_text
+    return remove_boilerplate_blocks(live_text, boilerplate, split_into_blocks(draft_text))
+
+def get_crawl_snapshot_path(domain):
+    """Return the snapshot file used for a crawled domain"""
+    safe_name = re.sub(r'[^A-Za-z0-9.-]', '_', domain)
+    return os.path.join(get_cache_dir("crawl"), safe_name + ".json")
+
+def load_crawl_snapshot(domain):
+    """Load the pages saved by the last crawl of a domain, keyed by normalized URL"""
+    try:
+        with open(get_crawl_snapshot_path(domain), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_crawl_snapshot(domain, page_contents):
+    """Save crawled pages, their validators and extractor for the next incremental crawl"""
+    snapshot = {
+        url: dict(data, links=sorted(data['links']))
+        for url, data in page_contents.items()
+    }
+    path = get_crawl_snapshot_path(domain)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(temp_path, path)
+
+def crawl_website(base_url, max_pages=100, progress_callback=None):
+    """Crawl a website starting from base_url and extract URLs with their content
+    
+    If given, progress_callback(pages_crawled, pages_per_second) is called
+    from the calling thread while the crawl is running.
+    """
     import urllib.parse
     from urllib.robotparser import RobotFileParser
     import time
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    
+    settings = load_settings()
+    workers = max(1, int(settings['crawl_workers']))
     
     # Normalize base URL
     base_url = base_url.rstrip('/')
@@ -1881,25 +4205,35 @@ def crawl_website(base_url, max_pages=100):
     rp = RobotFileParser()
     rp.set_url(robots_url)
     try:
-        rp.read()
+        rp.parse(get_page_markup(fetch_page(robots_url)).splitlines())
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code in (401, 403):
+            rp.disallow_all = True
+        else:
+            rp.allow_all = True
     except:
-        pass  # If robots.txt is not accessible, we'll proceed with crawling
+        rp.allow_all = True  # If robots.txt is not accessible, we'll proceed with crawling
+    
+    # Seed the crawl from the sitemap when the site publishes one; following
+    # links is only needed for sites without a sitemap
+    sitemap_pages = discover_sitemap_urls(
+        base_url,
+        rp.site_maps() or [urllib.parse.urljoin(base_url, '/sitemap.xml')],
+        int(settings['sitemap_max_urls'])
+    )
+    follow_links = not sitemap_pages
+    if sitemap_pages:
+        max_pages = max(max_pages, min(len(sitemap_pages), int(settings['sitemap_max_urls'])))
+    
+    # Per-host politeness: honor robots.txt Crawl-delay when the site sets one
+    throttle = HostThrottle(float(settings['crawl_rate']), int(settings['crawl_burst']))
+    crawl_delay = rp.crawl_delay('*')
+    if crawl_delay:
+        throttle.set_delay(base_domain, float(crawl_delay))
     
     # Initialize variables
     visited_urls = set()
-    urls_to_visit = {base_url}
     page_contents = {}
-    
-    # Add delay between requests
-    request_delay = 0.5  # seconds
-    
-    # Headers for requests
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Connection': 'keep-alive',
-    }
 
     def normalize_url(url):
         """Normalize URL to avoid duplicates"""
@@ -1911,97 +4245,152 @@ def crawl_website(base_url, max_pages=100):
             normalized += '?' + parsed.query
         return normalized
 
-    def extract_links(soup, current_url):
+    def extract_links(extracted, current_url):
         """Extract all possible links from the page"""
         links = set()
         
-        # Find all elements that might contain links
-        for element in soup.find_all(['a', 'link', 'area', 'base', 'nav', 'menu']):
-            # Check href attribute
-            href = element.get('href')
-            if href:
-                try:
-                    absolute_url = urllib.parse.urljoin(current_url, href)
-                    parsed_url = urllib.parse.urlparse(absolute_url)
+        # Check the href of every element that might contain a link
+        for href in extracted['hrefs']:
+            try:
+                absolute_url = urllib.parse.urljoin(current_url, href)
+                parsed_url = urllib.parse.urlparse(absolute_url)
+                
+                # Only include URLs from the same domain and with http(s) scheme
+                if (parsed_url.netloc == base_domain and 
+                    parsed_url.scheme in ('http', 'https') and
+                    not any(ext in parsed_url.path.lower() for ext in ['.jpg', '.jpeg', '.png', '.gif', '.pdf', '.doc', '.docx'])):
                     
-                    # Only include URLs from the same domain and with http(s) scheme
-                    if (parsed_url.netloc == base_domain and 
-                        parsed_url.scheme in ('http', 'https') and
-                        not any(ext in parsed_url.path.lower() for ext in ['.jpg', '.jpeg', '.png', '.gif', '.pdf', '.doc', '.docx'])):
-                        
-                        normalized_url = normalize_url(absolute_url)
-                        links.add(normalized_url)
-                except:
-                    continue
+                    normalized_url = normalize_url(absolute_url)
+                    links.add(normalized_url)
+            except:
+                continue
         
         # Also look for links in navigation menus and other structures
-        for menu_item in soup.find_all(class_=lambda x: x and any(word in str(x).lower() for word in ['menu', 'nav', 'navigation'])):
-            for link in menu_item.find_all('a', href=True):
-                try:
-                    absolute_url = urllib.parse.urljoin(current_url, link['href'])
-                    if urllib.parse.urlparse(absolute_url).netloc == base_domain:
-                        normalized_url = normalize_url(absolute_url)
-                        links.add(normalized_url)
-                except:
-                    continue
+        for href in extracted['menu_hrefs']:
+            try:
+                absolute_url = urllib.parse.urljoin(current_url, href)
+                if urllib.parse.urlparse(absolute_url).netloc == base_domain:
+                    normalized_url = normalize_url(absolute_url)
+                    links.add(normalized_url)
+            except:
+                continue
         
         return links
     
     def fetch_url(url):
         try:
-            time.sleep(request_delay)
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
+            # Pages extracted by a different extractor are fetched and extracted again
+            extractor = get_extractor_identity(url)
+            previous = snapshot.get(normalize_url(url))
+            if previous and previous.get('extractor') != extractor:
+                previous = None
+            lastmod = sitemap_lastmod.get(normalize_url(url))
+            
+            # Unchanged according to the sitemap: reuse the snapshot as-is
+            if previous and lastmod and previous.get('lastmod') == lastmod:
+                return url, dict(previous, links=set(previous['links']))
+            
+            throttle.wait(urllib.parse.urlparse(url).netloc)
+            page = fetch_page(url, validators=previous, html_only=True)
+            
+            # Unchanged according to the server (304) or to the body hash
+            if previous and (page['status'] == 304 or
+                             hashlib.sha1(page['body']).hexdigest() == previous['content_hash']):
+                return url, dict(previous, links=set(previous['links']), lastmod=lastmod)
             
             # Check if it's an HTML page
-            content_type = response.headers.get('content-type', '').lower()
+            content_type = page['headers'].get('content-type', '').lower()
             if 'text/html' not in content_type:
                 return None
             
-            content, title, meta_desc = get_webpage_text(url)
+            extracted = extract_page(page)
+            links = extract_links(extracted, url)
+            content, title, meta_desc = extracted['text'], extracted['title'], extracted['meta']
             if "[ERROR" not in content:
-                # Extract links from the page
-                soup = BeautifulSoup(response.text, 'html.parser')
-                links = extract_links(soup, url)
-                
                 return url, {
                     'content': content,
                     'title': title,
                     'meta_desc': meta_desc,
-                    'links': links
+                    'links': links,
+                    'etag': page['headers'].get('ETag'),
+                    'last_modified': page['headers'].get('Last-Modified'),
+                    'lastmod': lastmod,
+                    'content_hash': hashlib.sha1(page['body']).hexdigest(),
+                    'extractor': extractor
                 }
         except Exception as e:
             print(f"Error fetching {url}: {str(e)}")
         return None
     
-    # Use ThreadPoolExecutor for parallel crawling
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        while urls_to_visit and len(visited_urls) < max_pages:
-            # Get next batch of URLs to process
-            batch = set()
-            while urls_to_visit and len(batch) < 5:
-                url = urls_to_visit.pop()
-                normalized_url = normalize_url(url)
-                if normalized_url not in visited_urls and rp.can_fetch('*', url):
-                    batch.add(url)
-                    visited_urls.add(normalized_url)
+    # Pages from the previous crawl of this domain, reused when unchanged
+    sitemap_lastmod = {normalize_url(url): lastmod for url, lastmod in sitemap_pages.items() if lastmod}
+    use_snapshot = settings['crawl_snapshot_enabled'].lower() == 'true'
+    snapshot = load_crawl_snapshot(base_domain) if use_snapshot else {}
+    
+    # Keep every worker busy: as soon as one page finishes, the next URL from
+    # the frontier is submitted instead of waiting for a whole batch
+    frontier = deque([base_url])
+    queued_urls = {normalize_url(base_url)}
+    for url in sitemap_pages:
+        normalized_url = normalize_url(url)
+        if normalized_url not in queued_urls:
+            queued_urls.add(normalized_url)
+            frontier.append(url)
+    in_flight = {}
+    started = time.time()
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while frontier or in_flight:
+            while frontier and len(in_flight) < workers and len(visited_urls) < max_pages:
+                url = frontier.popleft()
+                if not rp.can_fetch('*', url):
+                    continue
+                visited_urls.add(normalize_url(url))
+                in_flight[executor.submit(fetch_url, url)] = url
             
-            if not batch:
+            if not in_flight:
                 break
             
-            # Process batch in parallel
-            future_to_url = {executor.submit(fetch_url, url): url for url in batch}
-            
-            for future in as_completed(future_to_url):
+            # Wake up regularly so the progress callback can keep the UI alive
+            done, _ = wait(in_flight, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
                 result = future.result()
                 if result:
                     url, data = result
                     normalized_url = normalize_url(url)
                     page_contents[normalized_url] = data
+                    if not follow_links:
+                        continue
                     # Add new URLs to visit
                     for new_url in data['links']:
-                        if normalize_url(new_url) not in visited_urls:
-                            urls_to_visit.add(new_url)
+                        normalized_new_url = normalize_url(new_url)
+                        if normalized_new_url not in queued_urls:
+                            queued_urls.add(normalized_new_url)
+                            frontier.append(new_url)
+            
+            if progress_callback:
+                elapsed = time.time() - started
+                progress_callback(len(page_contents), len(page_contents) / elapsed if elapsed > 0 else 0.0)
+    
+    if use_snapshot and page_contents:
+        save_crawl_snapshot(base_domain, page_contents)
+    
+    # Blocks repeated across most of the site (cookie banners, CTAs, footers
+    # that escaped extraction) are not page content; drop them here and
+    # remember them so the comparison step can drop them too
+    if settings['boilerplate_enabled'].lower() == 'true':
+        boilerplate = find_boilerplate_blocks(
+            page_contents,
+            float(settings['boilerplate_min_share']),
+            int(settings['boilerplate_min_pages'])
+        )
+        save_site_boilerplate(get_site_key(base_url), boilerplate)
+        if boilerplate:
+            page_contents = {
+                url: dict(data, content=remove_boilerplate_blocks(data['content'], boilerplate))
+                for url, data in page_contents.items()
+            }
     
     return page_contents
 
@@ -2209,8 +4598,11 @@ def toggle_theme(mode):
     current_settings['dark_mode'] = str(is_dark_mode).lower()
     save_settings(current_settings)
 
-def auto_match_documents(docx_files, base_url, parent_window):
-    """Automatically match DOCX files to URLs based on content similarity"""
+def auto_match_documents(docx_files, base_url, parent_window, ingestion=None):
+    """Automatically match DOCX files to URLs based on content similarity.
+
+    Draft text comes from the given DocxIngestion when there is one.
+    """
     # Show progress window
     progress_window = tk.Toplevel(parent_window)
     progress_window.title("Matching Documents to URLs")
@@ -2290,8 +4682,12 @@ def auto_match_documents(docx_files, base_url, parent_window):
         status_label.config(text="Crawling website...")
         progress_window.update()
         
-        # Crawl the website
-        page_contents = crawl_website(base_url)
+        # Crawl the website, reporting throughput as pages come in
+        def show_crawl_progress(pages, pages_per_second):
+            status_label.config(text=f"Crawling website... {pages} pages ({pages_per_second:.1f} pages/sec)")
+            progress_window.update()
+        
+        page_contents = crawl_website(base_url, progress_callback=show_crawl_progress)
         
         if not page_contents:
             raise Exception("No pages found to crawl. Please check the URL and try again.")
@@ -2305,7 +4701,7 @@ def auto_match_documents(docx_files, base_url, parent_window):
         for docx_file in docx_files:
             try:
                 # Extract text from DOCX
-                docx_text = normalize_text(get_docx_text(docx_file))
+                docx_text = "\n\n".join(ingestion.get(docx_file) if ingestion else get_docx_blocks(docx_file))
                 
                 # Find potential matches
                 potential_matches = []
@@ -2369,6 +4765,9 @@ def auto_match_documents(docx_files, base_url, parent_window):
         return None
 
 if __name__ == "__main__":
+    # Needed by the DOCX ingestion process pool in the frozen executable
+    multiprocessing.freeze_support()
+    
     # Use tkdnd.Tk if available, otherwise use regular tk.Tk
     root = tkdnd.Tk() if USE_DND else tk.Tk()
     root.title("Verbatim AI")
@@ -2535,4 +4934,11 @@ if __name__ == "__main__":
     is_dark_mode = current_settings.get('dark_mode', 'false').lower() == 'true'
     apply_theme(is_dark_mode)
 
+    # Replaying without the archive cannot fetch anything; say so once up front
+    try:
+        get_fetch_archive()
+    except ArchiveMiss as e:
+        message = f"{e}\n\nPages cannot be fetched until fetch_archive_path points at a recorded archive."
+        root.after(0, lambda: messagebox.showerror("Replay Archive", message))
+
     root.mainloop() 
\ No newline at end of file
@@ -0,0 +1,70 @@
+"""The streaming DOCX reader must produce what python-docx produced.
+
+Every draft in docx_corpus/ is read with read_docx_blocks and through the
+python-docx path of get_docx_text. Restricted to paragraphs directly in the
+document body, the fast reader has to give exactly the same blocks:
+the same text, and headings wrapped in the same <hN> tags.
+
+Intended difference: the fast reader also reads paragraphs in table cells
+and text boxes, which python-docx's Document.paragraphs leaves out. Those
+are the only extra blocks it may add.
+"""
+import glob
+import os
+import sys
+import unittest
+from unittest import mock
+
+from docx import Document
+from docx.text.paragraph import Paragraph
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docx_corpus")
+
+
+def read_with_python_docx(path):
+    settings = dict(main.load_settings(), docx_fast_extraction='false')
+    with mock.patch.object(main, 'load_settings', return_value=settings):
+        return main.get_docx_text(path).split("\n\n")
+
+
+def table_and_text_box_paragraphs(path):
+    document = Document(path)
+    return {
+        Paragraph(p, None).text
+        for p in document.element.xpath('//w:tc//w:p | //w:txbxContent//w:p')
+    }
+
+
+class DocxReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.paths = sorted(glob.glob(os.path.join(CORPUS_DIR, "*.docx")))
+        self.assertTrue(self.paths)
+
+    def test_body_paragraphs_match_python_docx(self):
+        body_only = {main.WORD_NAMESPACE + 'body'}
+        for path in self.paths:
+            with self.subTest(draft=os.path.basename(path)):
+                with mock.patch.object(main, 'DOCX_BLOCK_CONTAINERS', body_only):
+                    blocks = main.read_docx_blocks(path)
+                self.assertEqual(blocks, read_with_python_docx(path))
+
+    def test_only_tables_and_text_boxes_are_added(self):
+        for path in self.paths:
+            with self.subTest(draft=os.path.basename(path)):
+                expected = iter(read_with_python_docx(path))
+                extra_texts = table_and_text_box_paragraphs(path)
+                next_expected = next(expected, None)
+                for block in main.read_docx_blocks(path):
+                    if block == next_expected:
+                        next_expected = next(expected, None)
+                    else:
+                        self.assertIn(block, extra_texts)
+                # Every python-docx block was found, in order
+                self.assertIsNone(next_expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
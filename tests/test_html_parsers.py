@@ -0,0 +1,61 @@
+"""Extraction must not depend on which HTML parser backend is installed.
+
+Every page in html_corpus/ is extracted with both html.parser and lxml and
+the paragraphs, title and meta description have to be identical.
+
+Known exception: pages in html_corpus/malformed/ are not compared. On
+broken markup the backends repair the tree differently. html.parser nests
+unclosed <p> and <li> elements inside each other, while lxml closes them
+the way browsers do. lxml also drops <![CDATA[...]]> sections in HTML. The
+extracted blocks therefore differ. Those pages are only checked to extract
+without errors on both backends.
+"""
+import glob
+import os
+import sys
+import unittest
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "html_corpus")
+
+
+def read_corpus(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def extract(markup, parser):
+    return main.extract_page_content(BeautifulSoup(markup, parser))
+
+
+@unittest.skipUnless(main.USE_LXML, "lxml is not installed")
+class ParserBackendTest(unittest.TestCase):
+    def test_corpus_is_extracted_identically(self):
+        pages = read_corpus(CORPUS_DIR)
+        self.assertTrue(pages)
+        for name, markup in pages:
+            with self.subTest(page=name):
+                text, title, meta = extract(markup, 'html.parser')
+                lxml_text, lxml_title, lxml_meta = extract(markup, 'lxml')
+                self.assertTrue(text)
+                # Compared block by block so a failure points at the paragraph
+                self.assertEqual(text.split("\n\n"), lxml_text.split("\n\n"))
+                self.assertEqual((title, meta), (lxml_title, lxml_meta))
+
+    def test_malformed_pages_extract_on_both_backends(self):
+        for name, markup in read_corpus(os.path.join(CORPUS_DIR, "malformed")):
+            for parser in ('html.parser', 'lxml'):
+                with self.subTest(page=name, parser=parser):
+                    text, _, _ = extract(markup, parser)
+                    self.assertTrue(text)
+
+
+if __name__ == '__main__':
+    unittest.main()
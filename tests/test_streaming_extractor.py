@@ -0,0 +1,62 @@
+"""The streaming extractor must give the same text as extract_page_content.
+
+Every page in html_corpus/ is fed to a StreamingExtractor in small chunks,
+so that tags, entities and multi-byte characters are split between them.
+The result has to equal extract_page_content on an html.parser tree, for
+malformed pages too. For well-formed pages it also has to equal the lxml
+tree, which is what html_parser 'auto' uses when lxml is installed.
+
+Known difference: on malformed pages the streaming extractor repairs the
+markup as html.parser does, not as lxml does (see test_html_parsers.py).
+"""
+import glob
+import os
+import sys
+import unittest
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "html_corpus")
+HEADERS = {'content-type': 'text/html; charset=utf-8'}
+
+
+def read_corpus(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        with open(path, 'rb') as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def stream(body, chunk_size=64):
+    extractor = main.StreamingExtractor()
+    for start in range(0, len(body), chunk_size):
+        extractor.feed_chunk(body[start:start + chunk_size], HEADERS)
+    return extractor.finish()
+
+
+def extract(body, parser):
+    return main.extract_page_content(BeautifulSoup(body.decode('utf-8'), parser))
+
+
+class StreamingExtractorTest(unittest.TestCase):
+    def test_matches_html_parser(self):
+        pages = read_corpus(CORPUS_DIR) + read_corpus(os.path.join(CORPUS_DIR, "malformed"))
+        self.assertTrue(pages)
+        for name, body in pages:
+            for chunk_size in (7, 64, len(body)):
+                with self.subTest(page=name, chunk_size=chunk_size):
+                    self.assertEqual(stream(body, chunk_size), extract(body, 'html.parser'))
+
+    @unittest.skipUnless(main.USE_LXML, "lxml is not installed")
+    def test_matches_lxml_on_well_formed_pages(self):
+        for name, body in read_corpus(CORPUS_DIR):
+            with self.subTest(page=name):
+                self.assertEqual(stream(body), extract(body, 'lxml'))
+
+
+if __name__ == '__main__':
+    unittest.main()